@@ -1,24 +1,67 @@
 from __future__ import absolute_import
 import os
+from collections import OrderedDict
+
 from celery import Celery
+from celery.signals import task_prerun, task_postrun
+from kombu import Exchange, Queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TaskIt.settings')
+# what djcelery.setup_loader() did in settings, djcelery is still imported by django.setup() as an installed app
+os.environ.setdefault('CELERY_LOADER', 'djcelery.loaders.DjangoLoader')
 from django.conf import settings
 
+from .db_router import enter_pinning_scope, exit_pinning_scope
+
 app = Celery('TaskIt')
 app.config_from_object('django.conf:settings')
 
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
-app.conf.update(
-    CELERY_RESULT_BACKEND='djcelery.backends.database:DatabaseBackend',
-)
+#: tasks of each queue, every queue is consumed by its own worker so a backlog on one never delays another
+TASK_QUEUES = OrderedDict([
+    ('reminders', ('todolist.tasks.send_delayed_mail', 'todolist.tasks.send_due_reminders')),
+    ('mail', ('todolist.tasks.send_account_mail',)),
+    ('bulk', ('todolist.tasks.create_random_user_accounts', 'todolist.tasks.rebalance_ranks')),
+    ('default', ()),
+])
+#: message priority of the tasks of each queue, for brokers that support it
+QUEUE_PRIORITIES = {'reminders': 9, 'mail': 6, 'bulk': 0, 'default': 3}
+MAX_PRIORITY = 10
 
 app.conf.update(
-    CELERY_RESULT_BACKEND='djcelery.backends.cache:CacheBackend',
+    # nothing reads task results, reminder delivery is tracked on TaskReminder instead
+    CELERY_IGNORE_RESULT=True,
+    # json messages can be read by anything watching the queues, pickle ones queued before are still accepted
+    CELERY_TASK_SERIALIZER='json',
+    CELERY_ACCEPT_CONTENT=['json', 'pickle'],
+    CELERY_DEFAULT_QUEUE='default',
+    # workers reserve one task at a time so priorities and rate limits apply to what is still queued
+    CELERYD_PREFETCH_MULTIPLIER=1,
+    CELERY_QUEUES=tuple(
+        Queue(name, Exchange(name), routing_key=name, queue_arguments={'x-max-priority': MAX_PRIORITY})
+        for name in TASK_QUEUES
+    ),
+    CELERY_ROUTES={
+        task: {'queue': name, 'routing_key': name, 'priority': QUEUE_PRIORITIES[name]}
+        for name, tasks in TASK_QUEUES.items() for task in tasks
+    },
+    # token buckets of each mail task, together they stay under the smtp provider's sending limit
+    CELERY_ANNOTATIONS={task: {'rate_limit': rate_limit} for task, rate_limit in settings.MAIL_RATE_LIMITS.items()},
 )
 
 
+@task_prerun.connect
+def pin_task_writes(**kwargs):
+    """Reads of a task that wrote stay on the primary until the task ends"""
+    enter_pinning_scope()
+
+
+@task_postrun.connect
+def unpin_task(**kwargs):
+    exit_pinning_scope()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
\ No newline at end of file
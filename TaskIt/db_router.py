@@ -0,0 +1,97 @@
+import random
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def pin_primary(wrote=False):
+    """Send the reads of the current thread to the primary, wrote marks that it also wrote"""
+    _state.pinned = True
+    _state.wrote = getattr(_state, 'wrote', False) or wrote
+
+
+def unpin_primary():
+    _state.pinned = False
+    _state.wrote = False
+
+
+def enter_pinning_scope():
+    """
+    Start pinning the thread to the primary once it writes, for a request or a celery task.
+    Scopes nest, like an eager task run by a request, the pin lasts until the outermost one exits.
+    """
+    _state.scopes = getattr(_state, 'scopes', 0) + 1
+
+
+def exit_pinning_scope():
+    _state.scopes -= 1
+    if not _state.scopes:
+        unpin_primary()
+
+
+def in_pinning_scope():
+    return getattr(_state, 'scopes', 0) > 0
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the primary and reads to a random database in settings.DATABASE_REPLICAS.
+    Once a thread writes in a request or task, its reads stay on the primary until it ends so it
+    reads its own writes. Writes outside of one, like a session saved after the pinning middleware,
+    don't pin the long lived threads of workers and commands.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned():
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if in_pinning_scope():
+            pin_primary(wrote=True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold copies of the primary, objects from any of them can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pin the reads of a request to the primary when it writes, and keep the client's
+    reads there for settings.REPLICA_PIN_SECONDS with a cookie while replicas catch up.
+    """
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unpin_primary()
+        enter_pinning_scope()
+        if request.method not in SAFE_METHODS or request.COOKIES.get(self.cookie_name):
+            pin_primary()
+        try:
+            response = self.get_response(request)
+            if has_written():
+                response.set_cookie(self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+            return response
+        finally:
+            exit_pinning_scope()
@@ -11,12 +11,10 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 import config
 
-import djcelery
-djcelery.setup_loader()
-
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -33,6 +31,29 @@ DEBUG = config.DEBUG
 ALLOWED_HOSTS = []
 # CELERYBEAT_SCHEDULER = "djcelery.schedulers.DatabaseScheduler"
 CELERY_BROKER_URL = 'amqp://localhost'
+CELERYBEAT_SCHEDULE = {
+    'send-due-reminders': {
+        'task': 'todolist.tasks.send_due_reminders',
+        'schedule': timedelta(minutes=1),
+    },
+    'rebalance-ranks': {
+        'task': 'todolist.tasks.rebalance_ranks',
+        'schedule': timedelta(hours=1),
+    },
+}
+
+# worker processes of each celery queue, see TaskIt.celery.TASK_QUEUES and the worker_commands command
+CELERY_QUEUE_CONCURRENCY = getattr(config, 'CELERY_QUEUE_CONCURRENCY', {
+    'reminders': 4,
+    'mail': 2,
+    'bulk': 1,
+    'default': 1,
+})
+# mails per minute each mail task may send, together under the sending rate of the smtp provider
+MAIL_RATE_LIMITS = getattr(config, 'MAIL_RATE_LIMITS', {
+    'todolist.tasks.send_delayed_mail': '30/m',
+    'todolist.tasks.send_account_mail': '10/m',
+})
 
 # Email settings
 DEV_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -48,6 +69,10 @@ EMAIL_SSL = False
 ACCOUNT_EMAIL_VERIFICATION = 'mandatory'
 ACCOUNT_EMAIL_REQUIRED = True
 ACCOUNT_EMAIL_CONFIRMATION_COOLDOWN = 20
+# account mail is sent by a celery task so signups don't wait on the mail server
+ACCOUNT_ADAPTER = 'todolist.adapter.AsyncAccountAdapter'
+ACCOUNT_MAIL_RETRY_DELAY = 30
+ACCOUNT_MAIL_MAX_RETRIES = 6
 
 # Application definition
 
@@ -74,11 +99,35 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 AUTHENTICATION_BACKENDS = (
-    'django.contrib.auth.backends.ModelBackend',
+    'todolist.authentication.CachedModelBackend',
     'guardian.backends.ObjectPermissionBackend',
 )
 
+# sessions and the users they log in are read from the cache when every process shares it,
+# see todolist.authentication. Set a shared cache like memcached in config.CACHES in production
+CACHES = getattr(config, 'CACHES', {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+#: cache backends that keep a copy per process, what one process drops stays cached in the others
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+if CACHES['default']['BACKEND'] in LOCAL_CACHES:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USER_CACHE_SECONDS = 60
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'todolist.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # responses of at least this many bytes are gzipped for clients that accept it
+    'COMPRESS_MIN_LENGTH': 1024,
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
@@ -92,8 +141,11 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'TaskIt.db_router.PrimaryPinningMiddleware',
+    'todolist.sharding.ListShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -126,9 +178,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # local stand-in for a read replica, refresh it from the primary with manage.py sync_replica
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+    # local second list shard, used when it is in LIST_SHARDS
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_shard1.sqlite3'),
+    },
 }
 
+DATABASE_ROUTERS = [
+    'todolist.sharding.ListShardRouter',
+    'TaskIt.db_router.PrimaryReplicaRouter',
+]
+
+# aliases todo lists and their items, reminders and object permissions are partitioned over
+LIST_SHARDS = getattr(config, 'LIST_SHARDS', ['default'])
+
+# aliases reads are spread over, an empty list keeps every query on the primary
+DATABASE_REPLICAS = getattr(config, 'DATABASE_REPLICAS', [])
+
+# how long a client keeps reading from the primary after it writes
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -15,7 +15,7 @@ Including another URLconf
 """
 from django.conf.urls import url, include
 from django.contrib import admin
-from todolist.views import AccountConfirm
+from todolist.views import AccountConfirm, AccountEmailVerificationSent
 
 
 regex = r"[\s\d\w().+-_',:&]+"
@@ -28,6 +28,9 @@ urlpatterns = [
     url(r'^rest-auth/registration/account-confirm-email/(?P<key>{0})/$'.format(regex),
         AccountConfirm.as_view(), name="account_confirm_email"),
     url(r'^rest-auth/registration/', include('rest_auth.registration.urls')),
+    # allauth redirects here after signup when email verification is mandatory
+    url(r'^account-email-verification-sent/$', AccountEmailVerificationSent.as_view(),
+        name='account_email_verification_sent'),
     # my urls now
     url(r'^', include('todolist.urls'), name='todolist')
 ]
@@ -0,0 +1,24 @@
+from allauth.account.adapter import DefaultAccountAdapter
+from django.db import transaction
+
+from .tasks import send_account_mail
+
+
+class AsyncAccountAdapter(DefaultAccountAdapter):
+    """
+    Account adapter that renders registration and confirmation mail in the request
+    and leaves sending it to the send_account_mail task, queued once the request's data is committed.
+    """
+
+    def send_mail(self, template_prefix, email, context):
+        msg = self.render_mail(template_prefix, email, context)
+        html = [content for content, mimetype in getattr(msg, 'alternatives', []) if mimetype == 'text/html']
+        message = {
+            'subject': msg.subject,
+            'body': msg.body,
+            'from_email': msg.from_email,
+            'to': msg.to,
+            'html': html[0] if html else None,
+            'content_subtype': msg.content_subtype
+        }
+        transaction.on_commit(lambda: send_account_mail.delay(**message))
@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_save, post_delete
 
 
 class TodolistConfig(AppConfig):
     name = 'todolist'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from .sharding import replicate_user, delete_replicated_user
+        from .authentication import forget_user, forget_logged_out_user
+        post_save.connect(replicate_user, sender=User)
+        post_delete.connect(delete_replicated_user, sender=User)
+        post_save.connect(forget_user, sender=User)
+        post_delete.connect(forget_user, sender=User)
+        user_logged_out.connect(forget_logged_out_user)
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return 'auth-user:{}'.format(user_id)
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in settings.LOCAL_CACHES
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that keeps the users it resolves for sessions in the cache for settings.USER_CACHE_SECONDS,
+    so with cached_db sessions an authenticated request reads neither the session nor the user from the database.
+    Cached users are dropped when they are saved, deleted or log out, so a changed password ends the other
+    sessions on their next request.
+    Users are only cached when the default cache is shared by every process, with a local memory cache
+    a user dropped in one process would stay cached in the others, so it works like ModelBackend.
+    """
+
+    def get_user(self, user_id):
+        if not cache_is_shared():
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_SECONDS)
+        return user
+
+
+def forget_user(sender, instance, **kwargs):
+    cache.delete(user_cache_key(instance.pk))
+
+
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        cache.delete(user_cache_key(user.pk))
@@ -0,0 +1,73 @@
+import random
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ._bench import bench_database, best_time
+
+
+class Command(BaseCommand):
+    help = "Benchmark the agenda of a user belonging to hundreds of lists against reading every item of those lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lists', type=int, default=300)
+        parser.add_argument('--items', type=int, default=50, help="items per list")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            from ...models import User, TaskList, TaskItem
+            from ...views import AgendaView
+
+            user = User.objects.create_user('bench', 'bench@example.com', 'password')
+            owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+            now = timezone.now()
+            random.seed(0)
+            for i in range(options['lists']):
+                task_list = TaskList.objects.create(owner=user if i % 10 == 0 else owner, name='list {}'.format(i))
+                task_list.members.add(user)
+                # most items have no due date or are far off, a few are due this week
+                TaskItem.objects.bulk_create(
+                    TaskItem(name='item {}'.format(j), creator=owner, task_list=task_list,
+                             done=random.random() < 0.3,
+                             due_at=now + timezone.timedelta(hours=random.randint(-24 * 30, 24 * 180))
+                             if j % 2 else None)
+                    for j in range(options['items'])
+                )
+            until = now + timezone.timedelta(days=7)
+            query = urlencode({'until': until.isoformat()})
+            view = AgendaView.as_view()
+            factory = APIRequestFactory()
+
+            def agenda():
+                ids, url = [], '/agenda/?page_size=200&' + query
+                while url:
+                    request = factory.get(url)
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    ids.extend(item['id'] for item in response.data['results'])
+                    url = response.data['next']
+                return ids
+
+            def first_page():
+                request = factory.get('/agenda/?page_size=50&' + query)
+                force_authenticate(request, user=user)
+                return view(request).data
+
+            def scan():
+                items = TaskItem.objects.filter(task_list__in=user.todo_list_members.all()).values('id', 'due_at', 'done')
+                due = [item for item in items if not item['done'] and item['due_at'] is not None and item['due_at'] < until]
+                return [item['id'] for item in sorted(due, key=lambda item: (item['due_at'], item['id']))]
+
+            if agenda() != scan():
+                raise CommandError("The agenda and the scan of every item found different items")
+            total = options['lists'] * options['items']
+            scan_time = best_time(scan, options['repeat'])
+            agenda_time = best_time(agenda, options['repeat'])
+            page_time = best_time(first_page, options['repeat'])
+            self.stdout.write("{} lists, {} items, {} due: scan {:.1f}ms, whole agenda {:.1f}ms ({:.1f}x), "
+                              "first page {:.1f}ms".format(
+                                  options['lists'], total, len(scan()), scan_time * 1000, agenda_time * 1000,
+                                  scan_time / agenda_time, page_time * 1000))
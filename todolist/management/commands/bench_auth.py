@@ -0,0 +1,71 @@
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from ...authentication import cache_is_shared
+from ._bench import bench_database, best_time
+
+#: the settings before sessions and users were cached
+UNCACHED_SETTINGS = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'AUTHENTICATION_BACKENDS': ('django.contrib.auth.backends.ModelBackend',
+                                'guardian.backends.ObjectPermissionBackend'),
+}
+
+
+def shared_cache_settings(location):
+    """Settings that cache sessions and users in a file cache, shared by the processes of one host"""
+    return {
+        'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                               'LOCATION': location}},
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    }
+
+
+def authentication_queries(queries):
+    return [query for query in queries if '"django_session"' in query['sql'] or 'FROM "auth_user"' in query['sql']]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the queries and time session authentication costs per request, with and without caching"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, label, username, options):
+        from ...models import User
+        User.objects.create_user(username, '{}@example.com'.format(username), 'password')
+        client = Client()
+        client.login(username=username, password='password')
+        # warm the session and user caches
+        client.get('/lists/')
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/lists/')
+        # the query log is reset by the next request
+        queries = captured.captured_queries
+        if response.status_code != 200:
+            raise CommandError("{}: /lists/ answered {}".format(label, response.status_code))
+
+        def requests():
+            for _ in range(options['requests']):
+                client.get('/lists/')
+
+        elapsed = best_time(requests, options['repeat'])
+        self.stdout.write("{}: {} authentication queries of {} per request, {:.2f}ms per request".format(
+            label, len(authentication_queries(queries)), len(queries), elapsed * 1000 / options['requests']
+        ))
+
+    def handle(self, *args, **options):
+        with bench_database():
+            with override_settings(**UNCACHED_SETTINGS):
+                self.measure("database sessions", 'uncached', options)
+            if cache_is_shared():
+                self.measure("cached sessions and users", 'cached', options)
+                return
+            # users are not cached in local memory, measure with a file cache instead
+            with tempfile.TemporaryDirectory() as location, override_settings(**shared_cache_settings(location)):
+                self.measure("sessions and users cached in files", 'cached', options)
@@ -0,0 +1,73 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, OperationalError
+from django.test.utils import override_settings
+
+from TaskIt.db_router import unpin_primary
+
+
+class Command(BaseCommand):
+    help = ("Benchmark mixed read/write throughput with every query on one SQLite primary "
+            "against reads spread to a SQLite replica file")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=500, help="operations per thread")
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--items', type=int, default=500)
+
+    def handle(self, *args, **options):
+        from ...models import User, TaskList, TaskItem
+
+        directory = tempfile.mkdtemp()
+        connections.close_all()
+        try:
+            for alias in ('default', 'replica'):
+                connections.databases[alias]['NAME'] = os.path.join(directory, '{}.sqlite3'.format(alias))
+            call_command('migrate', verbosity=0, interactive=False)
+            user = User.objects.create_user('bench', 'bench@example.com', 'password')
+            task_list = TaskList.objects.create(owner=user, name='bench list')
+            TaskItem.objects.bulk_create(
+                TaskItem(name='item {}'.format(i), creator=user, task_list=task_list) for i in range(options['items'])
+            )
+            connections.close_all()
+            shutil.copyfile(connections.databases['default']['NAME'], connections.databases['replica']['NAME'])
+
+            def work(errors):
+                rng = random.Random()
+                for _ in range(options['operations']):
+                    # every operation stands for a request of its own
+                    unpin_primary()
+                    try:
+                        if rng.random() < options['write_ratio']:
+                            TaskItem.objects.create(name='written', creator_id=user.id, task_list_id=task_list.id)
+                        else:
+                            list(TaskItem.objects.filter(task_list_id=task_list.id).values('id', 'name', 'done')[:100])
+                    except OperationalError:
+                        errors.append(1)
+                connections.close_all()
+
+            for label, replicas in (('primary only', []), ('primary + replica', ['replica'])):
+                errors = []
+                threads = [threading.Thread(target=work, args=(errors,)) for _ in range(options['threads'])]
+                with override_settings(DATABASE_REPLICAS=replicas):
+                    start = time.perf_counter()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    elapsed = time.perf_counter() - start
+                total = options['threads'] * options['operations']
+                self.stdout.write("{}: {:.0f} ops/s, {} locked errors out of {} operations".format(
+                    label, total / elapsed, len(errors), total
+                ))
+        finally:
+            connections.close_all()
+            shutil.rmtree(directory)
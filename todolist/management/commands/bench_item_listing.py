@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ._bench import bench_database, best_time
+
+
+class Command(BaseCommand):
+    help = "Benchmark item listing rows per second of the serializers against the values() fast path"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            from ...models import User, TaskList, TaskItem, TaskReminder
+            from ...serializers import TaskSerializer, CreateTaskSerializer, ItemRowSerializer
+
+            user = User.objects.create_user('bench', 'bench@example.com', 'password')
+            task_list = TaskList.objects.create(owner=user, name='bench list')
+            TaskItem.objects.bulk_create(
+                TaskItem(name='item {}'.format(i), creator=user, task_list=task_list, done=i % 2 == 0)
+                for i in range(options['items'])
+            )
+            TaskReminder.objects.bulk_create(
+                TaskReminder(item=item, creator=user, task_id=str(item.id))
+                for item in TaskItem.objects.filter(task_list=task_list)[::3]
+            )
+            queryset = TaskItem.objects.filter(task_list=task_list).order_by('id')
+            request = Request(APIRequestFactory().get('/lists/{}/items/'.format(task_list.id)))
+            renderer = JSONRenderer()
+
+            for serializer_class in (CreateTaskSerializer, TaskSerializer):
+                def serialized():
+                    return renderer.render(serializer_class(queryset.all(), many=True, context={'request': request}).data)
+
+                def fast():
+                    rows = ItemRowSerializer(serializer_class.Meta.fields, request=request)
+                    return renderer.render(rows.serialize(queryset.all()))
+
+                if serialized() != fast():
+                    raise CommandError("{} and the fast path render different output".format(serializer_class.__name__))
+                serialized_time = best_time(serialized, options['repeat'])
+                fast_time = best_time(fast, options['repeat'])
+                self.stdout.write("{}: {:.0f} rows/s serializer, {:.0f} rows/s fast path ({:.1f}x), output identical".format(
+                    serializer_class.__name__, options['items'] / serialized_time, options['items'] / fast_time,
+                    serialized_time / fast_time
+                ))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ...renderers import FastJSONRenderer, orjson
+from ._bench import bench_database, best_time
+
+
+class Command(BaseCommand):
+    help = "Benchmark render time and bytes on the wire of large list payloads, JSONRenderer against FastJSONRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with bench_database():
+            from ...models import User, TaskList, TaskItem
+            from ...views import CreateListItem, TaskListView
+
+            self.stdout.write("encoder: {}".format('orjson' if orjson is not None else 'json (orjson not installed)'))
+            user = User.objects.create_user('bench', 'bench@example.com', 'password')
+            factory = APIRequestFactory()
+            for size in options['sizes']:
+                task_list = TaskList.objects.create(owner=user, name='{} items'.format(size))
+                TaskItem.objects.bulk_create(
+                    TaskItem(name='item {}'.format(i), creator=user, task_list=task_list, done=i % 2 == 0)
+                    for i in range(size)
+                )
+                payloads = (
+                    ('CreateListItem', CreateListItem, '/lists/{}/items/?expand=creator,done'),
+                    ('TaskListSerializer', TaskListView, '/lists/{}/?expand=items'),
+                )
+                for name, view_class, url in payloads:
+                    request = factory.get(url.format(task_list.id))
+                    force_authenticate(request, user=user)
+                    data = view_class.as_view()(request, list_pk=task_list.id).data
+                    self.report('{} {} items'.format(name, size), data, options['repeat'])
+
+    def report(self, label, data, repeat):
+        factory = APIRequestFactory()
+        variants = (
+            ('JSONRenderer', JSONRenderer(), factory.get('/')),
+            ('FastJSONRenderer', FastJSONRenderer(), factory.get('/')),
+            ('FastJSONRenderer accepting gzip', FastJSONRenderer(), factory.get('/', HTTP_ACCEPT_ENCODING='gzip')),
+        )
+        results = []
+        for name, renderer, request in variants:
+            def render():
+                response = Response()
+                response.accepted_renderer = renderer
+                content = renderer.render(data, 'application/json', {'request': request, 'response': response})
+                return content, response
+
+            content, response = render()
+            results.append((name, best_time(render, repeat), len(content),
+                            response.get('Content-Encoding', 'identity')))
+        self.stdout.write("{}:\n  {}".format(label, '\n  '.join(
+            "{} {:.1f}ms {} bytes {}".format(name, elapsed * 1000, size, encoding)
+            for name, elapsed, size, encoding in results
+        )))
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+#: what each startup runs in a fresh interpreter
+STARTUP_COMMANDS = (
+    ('manage.py check', [sys.executable, 'manage.py', 'check']),
+    ('wsgi app load', [sys.executable, '-c', 'import TaskIt.wsgi']),
+    ('celery worker boot', [sys.executable, '-c',
+                            'from TaskIt.celery import app; app.loader.import_default_modules()']),
+)
+
+#: seconds each startup may take, enforced by the test suite, several times what they take on a laptop
+#: so a loaded machine passes while an import that queries the database or hangs doesn't
+STARTUP_BUDGETS = {
+    'manage.py check': 5.0,
+    'wsgi app load': 5.0,
+    'celery worker boot': 5.0,
+}
+
+
+def time_startup(command):
+    """Return the seconds a command takes to run in a fresh interpreter"""
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=settings.BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(result.stderr.decode())
+    return elapsed
+
+
+class Command(BaseCommand):
+    help = "Benchmark cold start of manage.py check, the wsgi app and a celery worker against their budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        over_budget = []
+        for name, command in STARTUP_COMMANDS:
+            elapsed = min(time_startup(command) for _ in range(options['repeat']))
+            self.stdout.write("{}: {:.2f}s (budget {:.1f}s)".format(name, elapsed, STARTUP_BUDGETS[name]))
+            if elapsed > STARTUP_BUDGETS[name]:
+                over_budget.append(name)
+        if over_budget:
+            raise CommandError("Over budget: {}".format(', '.join(over_budget)))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import TaskList
+from ...sharding import move_list, shard_for_list
+
+
+class Command(BaseCommand):
+    help = ("Move a todo list with its members, items, reminders and object permissions to another list shard. "
+            "Items and reminders keep their ids.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('list_id', type=int)
+        parser.add_argument('target', help="database alias in LIST_SHARDS")
+
+    def handle(self, *args, **options):
+        list_id, target = options['list_id'], options['target']
+        if target not in settings.LIST_SHARDS:
+            raise CommandError("{} is not in LIST_SHARDS".format(target))
+        source = shard_for_list(list_id)
+        if not TaskList.objects.using(source).filter(pk=list_id).exists():
+            raise CommandError("List {} not found on {}".format(list_id, source))
+        moved = move_list(list_id, target)
+        self.stdout.write("Moved list {} with {} items from {} to {}".format(list_id, moved, source, target))
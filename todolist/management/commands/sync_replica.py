@@ -0,0 +1,21 @@
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database over the replicas in DATABASE_REPLICAS, "
+            "standing in for replication on local runs. Stop writers first.")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas in DATABASE_REPLICAS")
+        aliases = ['default'] + list(settings.DATABASE_REPLICAS)
+        if any(settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3' for alias in aliases):
+            raise CommandError("sync_replica only copies SQLite databases")
+        connections.close_all()
+        for alias in settings.DATABASE_REPLICAS:
+            shutil.copyfile(settings.DATABASES['default']['NAME'], settings.DATABASES[alias]['NAME'])
+            self.stdout.write("Copied primary to {}".format(alias))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from TaskIt.celery import TASK_QUEUES
+
+
+class Command(BaseCommand):
+    help = "Print the celery commands to run a worker for each queue, with its CELERY_QUEUE_CONCURRENCY, and beat"
+
+    def handle(self, *args, **options):
+        for queue in TASK_QUEUES:
+            self.stdout.write("celery worker -A TaskIt -Q {0} -n {0}@%h -c {1} -Ofair".format(
+                queue, settings.CELERY_QUEUE_CONCURRENCY.get(queue, 1)
+            ))
+        self.stdout.write("celery beat -A TaskIt")
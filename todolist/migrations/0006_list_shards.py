@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 07:40
+from __future__ import unicode_literals
+
+from django.core.management.color import no_style
+from django.db import connections, migrations, models
+
+
+def seed_directory(apps, schema_editor):
+    """Record the lists already on this database in the directory, which lives on the default database"""
+    alias = schema_editor.connection.alias
+    TaskList = apps.get_model('todolist', 'TaskList')
+    ListShard = apps.get_model('todolist', 'ListShard')
+    ListShard.objects.using('default').bulk_create(
+        ListShard(id=list_id, alias=alias) for list_id in TaskList.objects.using(alias).values_list('id', flat=True)
+    )
+    # the ids were given explicitly, move sequences like PostgreSQL's past them for the lists created next
+    default = connections['default']
+    with default.cursor() as cursor:
+        for sql in default.ops.sequence_reset_sql(no_style(), [ListShard]):
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0005_reminder_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(blank=True, max_length=100)),
+            ],
+        ),
+        migrations.RunPython(seed_directory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 07:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# copied from todolist.ranking as it was, so later changes to ranking don't change this migration
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+RANK_WIDTH = 4
+
+
+def encode_rank(value, width):
+    rank = ''
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        rank = DIGITS[digit] + rank
+    return rank
+
+
+def spaced_ranks(count):
+    width = RANK_WIDTH
+    while BASE ** width < 2 * BASE * (count + 1):
+        width += 1
+    step = BASE ** width // (2 * (count + 1)) // BASE * BASE
+    return [encode_rank(BASE ** width // 4 + index * step + 1, width) for index in range(1, count + 1)]
+
+
+def rank_existing_items(apps, schema_editor):
+    """Rank the items already on this database in the order they were created"""
+    alias = schema_editor.connection.alias
+    TaskItem = apps.get_model('todolist', 'TaskItem')
+    items = TaskItem.objects.using(alias)
+    for list_id in items.order_by('task_list_id').values_list('task_list_id', flat=True).distinct():
+        item_ids = list(items.filter(task_list_id=list_id).order_by('id').values_list('id', flat=True))
+        for item_id, rank in zip(item_ids, spaced_ranks(len(item_ids))):
+            TaskItem.objects.using(alias).filter(pk=item_id).update(rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0006_list_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskitem',
+            name='rank',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='taskitem',
+            index=models.Index(fields=['task_list', 'rank'], name='todolist_item_list_rank'),
+        ),
+        migrations.RunPython(rank_existing_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 07:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0007_item_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskitem',
+            name='due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='taskitem',
+            index=models.Index(fields=['due_at', 'done'], name='todolist_item_due_done'),
+        ),
+    ]
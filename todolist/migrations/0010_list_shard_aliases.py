@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 08:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def record_aliases(apps, schema_editor):
+    """Record the database of the lists on this database that were placed by hashing their id"""
+    alias = schema_editor.connection.alias
+    TaskList = apps.get_model('todolist', 'TaskList')
+    ListShard = apps.get_model('todolist', 'ListShard')
+    list_ids = list(TaskList.objects.using(alias).values_list('id', flat=True))
+    # in batches, sqlite limits the number of query parameters
+    for start in range(0, len(list_ids), 500):
+        ListShard.objects.using('default').filter(alias='', pk__in=list_ids[start:start + 500]).update(alias=alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0009_id_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_aliases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 08:26
+from __future__ import unicode_literals
+
+from django.core.management.color import no_style
+from django.db import connections, migrations, models
+
+
+def reset_directory_sequence(apps, schema_editor):
+    """The directory was seeded with explicit ids before 0006 reset its sequence, move it past them"""
+    ListShard = apps.get_model('todolist', 'ListShard')
+    default = connections['default']
+    with default.cursor() as cursor:
+        for sql in default.ops.sequence_reset_sql(no_style(), [ListShard]):
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0010_list_shard_aliases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listshard',
+            name='moving',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(reset_directory_sequence, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,83 @@
 from django.utils import timezone
-from django.db import models
+from django.db import models, router
+from django.db.models import Max
 from django.contrib.auth.models import User
+from .recurrence import compile_rule
+from .ranking import rank_between
 
 # Create your models here.
 
 
+class ListShard(models.Model):
+    """
+    Directory of the database each TaskList and its children live on, kept on the default database.
+    Its ids are the TaskList ids so they are unique across every shard.
+    """
+    #: database alias in settings.LIST_SHARDS, picked when the list is created, see sharding.place_list
+    alias = models.CharField(max_length=100, blank=True)
+    #: set while sharding.move_list copies the list, writes to it are refused until it is on its new shard
+    moving = models.BooleanField(default=False)
+
+
+class IdSequence(models.Model):
+    """
+    Last id handed out for items or reminders, kept on the default database.
+    While there are several shards their ids come from here so they are unique across shards
+    and kept when their list moves, see sharding.allocate_ids.
+    """
+    #: model label, like todolist.taskitem
+    name = models.CharField(max_length=100, primary_key=True)
+    last = models.BigIntegerField(default=0)
+
+
+def allocate_id(instance):
+    """Give a new item or reminder an id unique across every shard"""
+    from .sharding import allocate_ids, is_sharded
+    if instance.pk is None and is_sharded():
+        instance.pk = allocate_ids(type(instance))[0]
+
+
+class ListChildQuerySet(models.QuerySet):
+    """
+    Rows that belong to a list and live on its shard.
+    create without an explicit database lets the router place the new row from its list.
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, batch_size=None):
+        from .sharding import allocate_ids, is_sharded
+        objs = list(objs)
+        new_objs = [obj for obj in objs if obj.pk is None]
+        if new_objs and is_sharded():
+            for obj, pk in zip(new_objs, allocate_ids(self.model, len(new_objs))):
+                obj.pk = pk
+        return super().bulk_create(objs, batch_size)
+
+
+class TaskItemQuerySet(ListChildQuerySet):
+
+    def bulk_create(self, objs, batch_size=None):
+        objs = list(objs)
+        unranked = [obj for obj in objs if not obj.rank]
+        if unranked:
+            # like save, new items go to the end of their list, in the order given
+            self._for_write = True
+            last_ranks = dict(self.model._base_manager.using(self.db).filter(
+                task_list_id__in={obj.task_list_id for obj in unranked}
+            ).values('task_list_id').annotate(last=Max('rank')).values_list('task_list_id', 'last'))
+            for obj in unranked:
+                obj.rank = rank_between(last_ranks.get(obj.task_list_id) or '', '')
+                last_ranks[obj.task_list_id] = obj.rank
+        return super().bulk_create(objs, batch_size)
+
+
 class TaskList(models.Model):
     owner = models.ForeignKey(User, related_name='todo_list')
     name = models.CharField(max_length=200)
@@ -18,6 +91,15 @@ class TaskList(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            from .sharding import is_sharded, place_list
+            self.pk, alias = place_list()
+            if is_sharded():
+                # the database picked before the list had an id doesn't know its shard
+                kwargs['using'] = alias
+        super().save(*args, **kwargs)
+
 
 class TaskItem(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
@@ -26,19 +108,69 @@ class TaskItem(models.Model):
     task_list = models.ForeignKey(TaskList, related_name='tasks')
     done = models.BooleanField(default=False)
     name = models.CharField(max_length=200)
+    #: position in the list, items are ordered by rank then id, see ranking.rank_between
+    rank = models.CharField(max_length=255, blank=True)
+    due_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TaskItemQuerySet.as_manager()
 
     class Meta:
         permissions = (
             ('add_reminder', 'Add reminder'),
             ('delete_reminder', 'Delete reminder'),
         )
+        indexes = [
+            models.Index(fields=['task_list', 'rank'], name='todolist_item_list_rank'),
+            # the agenda reads the not done items due in a window across many lists
+            models.Index(fields=['due_at', 'done'], name='todolist_item_due_done'),
+        ]
 
     def __str__(self):
         return "Item: {}. From list {}".format(self.name, self.task_list)
 
+    def save(self, *args, **kwargs):
+        allocate_id(self)
+        if self._state.adding and not self.rank:
+            # new items go to the end of their list
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            last = type(self)._base_manager.using(using).filter(task_list_id=self.task_list_id).aggregate(
+                last=Max('rank'))['last']
+            self.rank = rank_between(last or '', '')
+        super().save(*args, **kwargs)
+
 
 class TaskReminder(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
     item = models.OneToOneField(TaskItem)
     #: celery task_id
     task_id = models.TextField()
     creator = models.ForeignKey(User, related_name='reminders')
+    #: repeat every interval, or on a cron expression like '0 9 * * 1-5'
+    interval = models.DurationField(null=True, blank=True)
+    cron = models.CharField(max_length=100, blank=True)
+    #: next time a recurring reminder fires, indexed so a tick only reads the due ones
+    next_run_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    #: comma separated emails a recurring reminder is sent to
+    recipients = models.TextField(blank=True)
+    #: delivery state written by the send_delayed_mail task
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    objects = ListChildQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        allocate_id(self)
+        super().save(*args, **kwargs)
+
+    @property
+    def rule(self):
+        return compile_rule(self.interval, self.cron)
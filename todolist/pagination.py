@@ -0,0 +1,116 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class MembersPagination(PageNumberPagination):
+    """Page through the members of a todo list. Example /lists/1/members/?page=2&page_size=100"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class MergedQuerySets:
+    """
+    The rows of several querysets ordered by key, one per list shard, as a sequence a Paginator can page.
+    A slice reads at most as many rows as its end from each queryset, which must be ordered by key too.
+    """
+
+    def __init__(self, querysets, key):
+        self.querysets = querysets
+        self.key = key
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __getitem__(self, index):
+        rows = []
+        for queryset in self.querysets:
+            rows.extend(queryset[:index.stop])
+        rows.sort(key=self.key)
+        return rows[index]
+
+
+class BootstrapPagination(PageNumberPagination):
+    """Page through the lists of the bootstrap document. Example /bootstrap/?page=2&page_size=10"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """queryset can also be a list of querysets ordered by id, one per list shard, whose pages are merged"""
+        if isinstance(queryset, list):
+            queryset = queryset[0] if len(queryset) == 1 else MergedQuerySets(queryset, key=lambda row: row['id'])
+        return super().paginate_queryset(queryset, request, view)
+
+
+class AgendaPagination(BasePagination):
+    """
+    Keyset pagination of items by (due_at, id). Example /agenda/?cursor=...&page_size=20
+    The cursor is the due date and id of the last item of the previous page, so every page
+    is read from the index where the last one ended however deep it is.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            due_at, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            due_at = parse_datetime(due_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if due_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return due_at, pk
+
+    def encode_cursor(self, row):
+        return urlsafe_b64encode('{}|{}'.format(row['due_at'].isoformat(), row['id']).encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return the page of values() rows after the cursor.
+        queryset can also be a list of querysets, one per list shard, whose pages are merged.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        querysets = queryset if isinstance(queryset, list) else [queryset]
+        rows = []
+        for queryset in querysets:
+            if cursor is not None:
+                queryset = queryset.filter(Q(due_at__gt=cursor[0]) | Q(due_at=cursor[0], id__gt=cursor[1]))
+            rows.extend(queryset.order_by('due_at', 'id')[:page_size + 1])
+        rows.sort(key=lambda row: (row['due_at'], row['id']))
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
@@ -3,20 +3,24 @@ from django.shortcuts import get_object_or_404
 from .models import TaskList
 
 
-class IsListOwnerOrItemCreator(permissions.BasePermission):
+class IsListOwnerOrMember(permissions.BasePermission):
+    """Custom permission to only allow the owner and members of the TaskList in the url"""
+
+    def has_permission(self, request, view):
+        todo_list = get_object_or_404(TaskList, pk=view.kwargs['list_pk'])
+        return request.user.id == todo_list.owner_id or todo_list.members.filter(pk=request.user.id).exists()
+
+
+class IsListOwnerOrItemCreator(IsListOwnerOrMember):
     """Custom permission to only allow owners of a TaskList to add items to it"""
 
     def has_object_permission(self, request, view, obj):
-        if obj.task_list.owner == request.user or obj.creator == request.user:
+        if obj.task_list.owner_id == request.user.id or obj.creator_id == request.user.id:
             return True
         else:
             if request.method == "GET" or request.method == "POST":
-                return request.user in obj.task_list.members.all()
+                return obj.task_list.members.filter(pk=request.user.id).exists()
             elif request.method == "PATCH":
                 return request.user.has_perm('change_taskitem', obj)
             elif request.method == "DELETE":
                 return request.user.has_perm('delete_taskitem', obj)
-
-    def has_permission(self, request, view):
-        todo_list = get_object_or_404(TaskList, pk=view.kwargs['list_pk'])
-        return request.user == todo_list.owner or request.user in todo_list.members.all()
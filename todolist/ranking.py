@@ -0,0 +1,69 @@
+#: rank digits in the order they sort, digits before lowercase letters in every collation
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+#: shortest ranks handed out by spaced_ranks, leaves room for many moves before ranks grow
+RANK_WIDTH = 4
+#: ranks longer than this are renormalized by the rebalance_ranks task
+MAX_RANK_LENGTH = 16
+
+
+def encode_rank(value, width):
+    rank = ''
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        rank = DIGITS[digit] + rank
+    return rank
+
+
+def step_rank(rank, step):
+    """Return the rank step units away with the same length, or None if there is no room left"""
+    value = int(rank, BASE) + step
+    while value % BASE == 0:
+        value += step
+    if 0 < value < BASE ** len(rank):
+        return encode_rank(value, len(rank))
+    return None
+
+
+def bisect_rank(before, after):
+    rank = ''
+    for position in range(len(before) + len(after) + 1):
+        low = DIGITS.index(before[position]) if position < len(before) else 0
+        high = DIGITS.index(after[position]) if position < len(after) else BASE
+        if high - low > 1:
+            return rank + DIGITS[(low + high) // 2]
+        rank += DIGITS[low]
+        if high - low == 1:
+            # rank is now below after whatever follows, only before bounds the next digits
+            after = ''
+    raise ValueError("No rank between '{}' and '{}'".format(before, after))
+
+
+def rank_between(before='', after=''):
+    """
+    Return a rank sorting strictly between before and after, '' meaning the start or the end of the list.
+    Ranks are base 36 fractions compared as strings, so there is always room between two of them
+    and moving an item only rewrites its own rank. Ranks never end with '0' to keep that room.
+    Moves to either end step by one unit so appending keeps ranks short.
+    """
+    if after and before >= after:
+        raise ValueError("Rank '{}' is not before '{}'".format(before, after))
+    if not before and not after:
+        return spaced_ranks(1)[0]
+    if not after:
+        return step_rank(before, 1) or bisect_rank(before, after)
+    if not before:
+        return step_rank(after, -1) or bisect_rank(before, after)
+    return bisect_rank(before, after)
+
+
+def spaced_ranks(count):
+    """
+    Return count ranks spread evenly over the middle half of the ranks of their length,
+    at least BASE units apart, used to renormalize the ranks of a list.
+    """
+    width = RANK_WIDTH
+    while BASE ** width < 2 * BASE * (count + 1):
+        width += 1
+    step = BASE ** width // (2 * (count + 1)) // BASE * BASE
+    return [encode_rank(BASE ** width // 4 + index * step + 1, width) for index in range(1, count + 1)]
@@ -0,0 +1,91 @@
+from functools import lru_cache
+from django.utils import timezone
+
+#: how far ahead a cron rule is searched before it is treated as never matching
+MAX_CRON_DAYS = 366 * 5
+
+
+def parse_cron_field(field, low, high):
+    """Expand one cron field such as '*/15', '1-5' or '0,30' into a sorted tuple of values"""
+    values = set()
+    for part in field.split(','):
+        value_range, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if value_range == '*':
+            start, end = low, high
+        elif '-' in value_range:
+            start, end = (int(value) for value in value_range.split('-'))
+        else:
+            start = end = int(value_range)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError("Cron field '{}' out of range {}-{}".format(field, low, high))
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+
+class IntervalRule:
+    """Fires every interval counting from the first run"""
+
+    def __init__(self, interval):
+        if interval < timezone.timedelta(minutes=1):
+            raise ValueError("Interval must be at least one minute")
+        self.interval = interval
+
+    def next_after(self, last_run, now=None):
+        """Return the first run after now, skipping runs missed since last_run"""
+        now = now or last_run
+        missed = (now - last_run) // self.interval if now > last_run else 0
+        return last_run + self.interval * (missed + 1)
+
+
+class CronRule:
+    """Fires on the minutes matching a five field cron expression 'minute hour day month weekday'"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs five fields")
+        minute, hour, day, month, weekday = fields
+        self.minutes = parse_cron_field(minute, 0, 59)
+        self.hours = parse_cron_field(hour, 0, 23)
+        self.days = parse_cron_field(day, 1, 31)
+        self.months = parse_cron_field(month, 1, 12)
+        # cron allows 7 for sunday, store sundays as 0
+        self.weekdays = tuple(sorted({value % 7 for value in parse_cron_field(weekday, 0, 7)}))
+        self.any_day = day == '*'
+        self.any_weekday = weekday == '*'
+
+    def matches_day(self, moment):
+        if moment.month not in self.months:
+            return False
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        # like cron, a restricted day and weekday match when either does
+        return day_match or weekday_match
+
+    def next_after(self, last_run, now=None):
+        """Return the first matching minute after both last_run and now"""
+        start = max(last_run, now or last_run).replace(second=0, microsecond=0) + timezone.timedelta(minutes=1)
+        midnight = start.replace(hour=0, minute=0)
+        for offset in range(MAX_CRON_DAYS):
+            day = midnight + timezone.timedelta(days=offset)
+            if not self.matches_day(day):
+                continue
+            for hour in self.hours:
+                for minute in self.minutes:
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate >= start:
+                        return candidate
+        raise ValueError("Cron expression never matches")
+
+
+@lru_cache(maxsize=1024)
+def compile_rule(interval=None, cron=''):
+    """Return the compiled rule of a recurring reminder, or None for a one shot reminder"""
+    if cron:
+        return CronRule(cron)
+    if interval:
+        return IntervalRule(interval)
+    return None
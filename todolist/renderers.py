@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#: smallest response body worth compressing, REST_FRAMEWORK['COMPRESS_MIN_LENGTH'] overrides it
+COMPRESS_MIN_LENGTH = 1024
+
+
+def accepts_gzip(request):
+    """Return whether the Accept-Encoding header of a request allows gzip, honouring q values"""
+    codings = {}
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[name.strip().lower()] = quality
+    return codings.get('gzip', codings.get('*', 0.0)) > 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, and gzips its responses when
+    the client accepts it and they are at least REST_FRAMEWORK['COMPRESS_MIN_LENGTH'] bytes.
+    Indented output and data orjson can't encode are rendered by JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        content = None
+        if orjson is not None and data is not None and not self.get_indent(accepted_media_type, renderer_context):
+            try:
+                # datetimes and types orjson doesn't know are encoded like JSONRenderer does
+                content = orjson.dumps(data, default=self.encoder_class().default,
+                                       option=orjson.OPT_PASSTHROUGH_DATETIME)
+            except TypeError:
+                pass
+        if content is None:
+            content = super().render(data, accepted_media_type, renderer_context)
+        return self.compress(content, renderer_context)
+
+    def compress(self, content, renderer_context):
+        request = renderer_context.get('request')
+        response = renderer_context.get('response')
+        # only the renderer of the response, not the browsable api showing its json
+        if request is None or response is None or getattr(response, 'accepted_renderer', None) is not self:
+            return content
+        min_length = settings.REST_FRAMEWORK.get('COMPRESS_MIN_LENGTH', COMPRESS_MIN_LENGTH)
+        if len(content) < min_length or response.has_header('Content-Encoding'):
+            return content
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not accepts_gzip(request):
+            return content
+        compressed = compress_string(content)
+        if len(compressed) >= len(content):
+            return content
+        response['Content-Encoding'] = 'gzip'
+        return compressed
@@ -2,28 +2,150 @@ from rest_framework import serializers, status
 from rest_framework.reverse import reverse
 from rest_framework.response import Response
 from collections import OrderedDict
+from functools import lru_cache
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Prefetch
+from django.http import Http404
 from guardian.shortcuts import get_perms_for_model, assign_perm
+from celery.utils import uuid
 from .models import TaskList, TaskItem, User, TaskReminder
 from .tasks import create_random_user_accounts, send_delayed_mail
+from .recurrence import compile_rule
+from .ranking import rank_between
 
 
-class TaskListsSerializer(serializers.HyperlinkedModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='tasklist-detail')
+def split_param(request, name):
+    """Return the comma separated values of a query parameter"""
+    if request is None:
+        return []
+    return [value for value in request.query_params.get(name, '').split(',') if value]
+
+
+def requested_fields(request, fields, expandable_fields=()):
+    """
+    Return the fields a request asks for, keeping the given order.
+    ?fields= names the fields wanted, without it every field is wanted except the expandable fields.
+    Fields named in ?expand= are wanted either way.
+    """
+    expand = split_param(request, 'expand')
+    sparse = split_param(request, 'fields')
+    if sparse:
+        return tuple(field for field in fields if field in sparse or field in expand)
+    return tuple(field for field in fields if field not in expandable_fields or field in expand)
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for the ?fields= and ?expand= query parameters.
+    Fields in Meta.expandable_fields are only rendered when named in ?expand= or ?fields=.
+    Serializers that only render drop unrequested fields up front so their relations are never read,
+    serializers given data keep every field for validation and only leave them out of their output.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wanted_fields = self.requested_fields(self.context.get('request'))
+        if 'data' not in kwargs:
+            for field in list(self.fields):
+                if field not in self.wanted_fields:
+                    self.fields.pop(field)
+
+    def to_representation(self, instance):
+        result = super().to_representation(instance)
+        return OrderedDict([(field, value) for field, value in result.items() if field in self.wanted_fields])
+
+    @classmethod
+    def requested_fields(cls, request):
+        return requested_fields(request, cls.Meta.fields, getattr(cls.Meta, 'expandable_fields', ()))
+
+
+class TaskListsSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='tasklist-detail', lookup_url_kwarg='list_pk')
 
     class Meta:
         model = TaskList
         fields = ('id', 'name', 'url')
 
 
-class ListMembersSerializer(serializers.ModelSerializer):
+class ListMembersSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
         fields = ('id', 'username')
 
 
+class BulkMembersSerializer(serializers.Serializer):
+    """
+    Add or remove many members of a todo list at once.
+    Users can be given by a single email, a list of emails and/or a list of user ids.
+    """
+    email = serializers.EmailField(required=False)
+    emails = serializers.ListField(child=serializers.EmailField(), required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, data):
+        if not (data.get('email') or data.get('emails') or data.get('ids')):
+            raise serializers.ValidationError("Email or id of a user required.")
+        return data
+
+    def resolve_users(self):
+        """Return the matching users and the emails and ids that matched nobody, using one query"""
+        emails = set(self.validated_data.get('emails', []))
+        if self.validated_data.get('email'):
+            emails.add(self.validated_data['email'])
+        ids = set(self.validated_data.get('ids', []))
+        users = list(User.objects.filter(Q(email__in=emails) | Q(pk__in=ids)).only('id', 'username', 'email'))
+        unknown = {
+            'emails': sorted(emails - {user.email for user in users}),
+            'ids': sorted(ids - {user.id for user in users})
+        }
+        return users, unknown
+
+    def add_members(self, task_list, users):
+        """Insert the users not already members with one bulk insert, return the ids of the existing members"""
+        through = TaskList.members.through
+        existing = set(through.objects.filter(
+            tasklist_id=task_list.id, user_id__in=[user.id for user in users]
+        ).values_list('user_id', flat=True))
+        with transaction.atomic():
+            through.objects.bulk_create([
+                through(tasklist_id=task_list.id, user_id=user.id) for user in users if user.id not in existing
+            ])
+        return existing
+
+    def create(self, validated_data):
+        """Add every resolved user not already a member"""
+        task_list = validated_data.get('task_list')
+        users, unknown = self.resolve_users()
+        try:
+            existing = self.add_members(task_list, users)
+        except IntegrityError:
+            # a concurrent request added some of them first, they are reported as already members
+            existing = self.add_members(task_list, users)
+        added = [user for user in users if user.id not in existing]
+        return {
+            'added': ListMembersSerializer(added, many=True).data,
+            'already_members': ListMembersSerializer([user for user in users if user.id in existing], many=True).data,
+            'unknown': unknown
+        }
+
+    def remove(self, task_list):
+        """Remove every resolved user that is a member with one bulk delete"""
+        users, unknown = self.resolve_users()
+        memberships = TaskList.members.through.objects.filter(
+            tasklist_id=task_list.id, user_id__in=[user.id for user in users]
+        )
+        member_ids = set(memberships.values_list('user_id', flat=True))
+        memberships.delete()
+        return {
+            'removed': ListMembersSerializer([user for user in users if user.id in member_ids], many=True).data,
+            'not_members': ListMembersSerializer([user for user in users if user.id not in member_ids], many=True).data,
+            'unknown': unknown
+        }
+
+
 class ItemHyperLinkMixin:
     """
     Mixin to link to an item with multiple parameters.
@@ -34,7 +156,7 @@ class ItemHyperLinkMixin:
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'list_pk': obj.task_list.id,
+            'list_pk': obj.task_list_id,
             'pk': obj.pk
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -54,12 +176,30 @@ class ItemRelatedHyperLink(ItemHyperLinkMixin, serializers.HyperlinkedRelatedFie
         super().__init__(*args, **kwargs)
 
 
-class TaskListSerializer(serializers.ModelSerializer):
+class TaskListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tasks = ItemRelatedHyperLink(many=True, read_only=True)
+    items = serializers.SerializerMethodField()
+    members = ListMembersSerializer(many=True, read_only=True)
 
     class Meta:
         model = TaskList
-        fields = ('id', 'name', 'tasks')
+        fields = ('id', 'name', 'tasks', 'items', 'members')
+        expandable_fields = ('items', 'members')
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields):
+        """Load only the columns and relations the requested fields read"""
+        queryset = queryset.only('id', 'name', 'owner_id')
+        if 'tasks' in fields:
+            queryset = queryset.prefetch_related(Prefetch('tasks', queryset=TaskItem.objects.only('id', 'task_list_id').order_by('rank', 'id')))
+        if 'members' in fields:
+            queryset = queryset.prefetch_related(Prefetch('members', queryset=User.objects.only('id', 'username')))
+        return queryset
+
+    def get_items(self, obj):
+        """Items rendered like TaskSerializer, with ?expand=items"""
+        rows = ItemRowSerializer(TaskSerializer.Meta.fields, request=self.context.get('request'))
+        return rows.serialize(TaskItem.objects.filter(task_list_id=obj.id).order_by('rank', 'id'))
 
 
 class ItemHyperLink(ItemHyperLinkMixin, serializers.HyperlinkedIdentityField):
@@ -69,12 +209,45 @@ class ItemHyperLink(ItemHyperLinkMixin, serializers.HyperlinkedIdentityField):
         super().__init__(*args, **kwargs)
 
 
-class CreateTaskSerializer(serializers.HyperlinkedModelSerializer):
+class CreateTaskSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = ItemHyperLink(view_name='taskitem-detail')
 
     class Meta:
         model = TaskItem
-        fields = ('id', 'name', 'url')
+        fields = ('id', 'name', 'url', 'due_at')
+        extra_kwargs = {'due_at': {'write_only': True}}
+
+
+class MoveItemSerializer(serializers.Serializer):
+    """
+    Move an item right after another item of its list, or to the top when after is null.
+    Only the moved item's rank is written.
+    """
+    after = serializers.IntegerField(allow_null=True)
+
+    def update(self, instance, validated_data):
+        siblings = TaskItem.objects.filter(task_list_id=instance.task_list_id).exclude(pk=instance.pk)
+        before = ''
+        if validated_data['after'] is not None:
+            before = siblings.filter(pk=validated_data['after']).values_list('rank', flat=True).first()
+            if before is None:
+                raise serializers.ValidationError({'after': "Item not on list"})
+        following = siblings.filter(rank__gt=before).order_by('rank', 'id').values_list('rank', flat=True).first()
+        instance.rank = rank_between(before, following or '')
+        TaskItem.objects.filter(pk=instance.pk).update(rank=instance.rank)
+        return instance
+
+
+class AgendaSerializer(serializers.Serializer):
+    """Window of the agenda, items due before until and, when given, from since"""
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        data.setdefault('until', timezone.now() + timezone.timedelta(days=7))
+        if 'since' in data and data['since'] >= data['until']:
+            raise serializers.ValidationError("since must be before until")
+        return data
 
 
 class ScheduleSerializer(serializers.Serializer):
@@ -87,39 +260,125 @@ def make_duration(**kwargs):
     return timezone.now() + timezone.timedelta(**kwargs)
 
 
+def reminder_recipients(item_id, list_id, member_ids):
+    """
+    Return the item name and the emails a reminder goes to using one query.
+    The list owner always gets the reminder, members only when requested.
+    Raises Http404 if the item is not on the list.
+    """
+    item = TaskItem.objects.filter(pk=item_id, task_list_id=list_id)
+    rows = item.values_list('name', 'task_list__owner__email')
+    if member_ids:
+        members = item.filter(task_list__members__in=member_ids).values_list('name', 'task_list__members__email')
+        rows = members.union(rows, all=True)
+    rows = list(rows)
+    if not rows:
+        raise Http404("No TaskItem matches the given query.")
+    return rows[0][0], [email for name, email in rows]
+
+
 class CreateTaskRemindersSerializer(serializers.Serializer):
     schedule = ScheduleSerializer(required=True)
     recipients = serializers.ListField(child=serializers.IntegerField(), required=False)
+    #: optional recurrence, repeat_every is an interval and repeat_cron a cron expression like '0 9 * * 1-5'
+    repeat_every = ScheduleSerializer(required=False)
+    repeat_cron = serializers.CharField(required=False, max_length=100)
+
+    def validate(self, data):
+        if 'repeat_every' in data and 'repeat_cron' in data:
+            raise serializers.ValidationError("Use either repeat_every or repeat_cron")
+        interval = timezone.timedelta(**data['repeat_every']) if 'repeat_every' in data else None
+        if interval is not None and not interval:
+            # an empty interval would make a one-shot reminder of a recurring one
+            raise serializers.ValidationError("repeat_every needs a duration")
+        try:
+            rule = compile_rule(interval, data.get('repeat_cron', ''))
+            if rule is not None:
+                rule.next_after(timezone.now())
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+        data['interval'] = interval
+        return data
 
     def create(self, validated_data):
         schedule = validated_data.pop('schedule', {'hours': 24})
         creator = validated_data.get('creator')
-        item = validated_data.get('item')
+        item_id = validated_data.get('item_id')
         members = validated_data.get('recipients', [creator.id])
-        member_list = [user.email for user in item.task_list.members.filter(pk__in=members)]
-        member_list.append(item.task_list.owner.email)
-
-        if hasattr(item, 'taskreminder'):
-            # return TaskReminder.objects.get(item=item)
+        item_name, member_list = reminder_recipients(item_id, validated_data.get('list_id'), members)
+        interval = validated_data.get('interval')
+        cron = validated_data.get('repeat_cron', '')
+        if interval or cron:
+            # recurring reminders are fired by the send_due_reminders periodic task
+            first_run = make_duration(**schedule)
+            if cron:
+                # the first run of a cron reminder matches its expression, from the schedule on
+                first_run = compile_rule(None, cron).next_after(first_run)
+            try:
+                with transaction.atomic():
+                    return TaskReminder.objects.create(
+                        creator=creator, item_id=item_id, interval=interval, cron=cron,
+                        next_run_at=first_run, recipients=','.join(member_list)
+                    )
+            except IntegrityError:
+                raise serializers.ValidationError("Task has reminder")
+
+        # the celery task id is made up front so the unique item constraint rejects duplicates before queueing
+        task_id = uuid()
+        try:
+            with transaction.atomic():
+                reminder = TaskReminder.objects.create(creator=creator, item_id=item_id, task_id=task_id)
+        except IntegrityError:
             raise serializers.ValidationError("Task has reminder")
         duration = make_duration(**schedule)
-        celery_task = send_delayed_mail.apply_async(eta=duration, kwargs={
-            "subject": "Reminder for todo list",
-            "recipients": member_list,
-            "message": "Reminder for item {}".format(item.name)
-        })
-        # celery_task = create_random_user_accounts.apply_async(eta=duration)
-        return TaskReminder.objects.create(creator=creator, item=item, task_id=celery_task.id)
+        try:
+            send_delayed_mail.apply_async(task_id=task_id, eta=duration, kwargs={
+                "subject": "Reminder for todo list",
+                "recipients": member_list,
+                "message": "Reminder for item {}".format(item_name),
+                "reminder_id": reminder.id,
+                "database": reminder._state.db
+            })
+        except Exception:
+            # a reminder without a queued mail would never be sent and refuse every retry as a duplicate
+            TaskReminder.objects.using(reminder._state.db).filter(pk=reminder.pk).delete()
+            raise
+        return reminder
+
+
+class ReminderStatusSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = TaskReminder
+        fields = ('status', 'sent_at', 'attempts')
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creator = serializers.CharField(source='creator.username')
     task_reminder = serializers.BooleanField(source='taskreminder')
+    reminder = ReminderStatusSerializer(source='taskreminder', read_only=True)
 
     class Meta:
         model = TaskItem
-        fields = ('id', 'name', 'creator', 'done', 'task_reminder')
-        read_only_fields = ('id', 'creator', 'task_reminder')
+        fields = ('id', 'name', 'creator', 'done', 'due_at', 'task_reminder', 'reminder')
+        read_only_fields = ('id', 'creator', 'task_reminder', 'reminder')
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields, related=(), columns=()):
+        """
+        Join and load only the columns and relations the requested fields read,
+        plus any related and columns the caller needs itself.
+        """
+        related = list(related)
+        columns = ['id', 'task_list_id', 'creator_id'] + list(columns)
+        columns.extend(field for field in ('name', 'done', 'due_at') if field in fields)
+        if 'creator' in fields:
+            related.append('creator')
+            columns.append('creator__username')
+        if 'task_reminder' in fields or 'reminder' in fields:
+            related.append('taskreminder')
+            columns.extend(['taskreminder__id', 'taskreminder__status', 'taskreminder__sent_at', 'taskreminder__attempts'])
+        return queryset.select_related(*related).only(*columns)
 
     def to_representation(self, instance):
         """Remove null fields from serializer"""
@@ -127,10 +386,142 @@ class TaskSerializer(serializers.ModelSerializer):
         return OrderedDict([(key, result[key]) for key in result if result[key] is not None])
 
 
+class ItemRowSerializer:
+    """
+    Read only fast path for item listings that renders the same as TaskSerializer and CreateTaskSerializer.
+    Only the columns the requested fields need are fetched with values() and rows are mapped
+    straight to dicts, without building per field serializer objects for every item.
+    """
+
+    #: values() columns needed by each field
+    columns = OrderedDict([
+        ('id', ('id',)),
+        ('name', ('name',)),
+        ('url', ('id', 'task_list_id')),
+        ('creator', ('creator__username',)),
+        ('done', ('done',)),
+        ('due_at', ('due_at',)),
+        ('task_reminder', ('taskreminder__id',)),
+        ('reminder', ('taskreminder__id', 'taskreminder__status', 'taskreminder__sent_at', 'taskreminder__attempts')),
+        ('list', ('task_list_id',)),
+    ])
+    # numbers that can't be real ids, reversed once and swapped for each row's ids
+    list_sentinel = '9999999901'
+    item_sentinel = '9999999902'
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, fields, request=None):
+        self.fields = tuple(fields)
+        self.request = request
+        self.renderers = [(field, getattr(self, 'render_{}'.format(field))) for field in self.fields]
+        if 'url' in self.fields:
+            url = reverse('taskitem-detail', request=request, kwargs={
+                'list_pk': self.list_sentinel, 'pk': self.item_sentinel
+            })
+            self.url_template = url.replace('{', '{{').replace('}', '}}').replace(
+                self.list_sentinel, '{0}').replace(self.item_sentinel, '{1}')
+
+    def get_columns(self):
+        return list(OrderedDict.fromkeys(column for field in self.fields for column in self.columns[field]))
+
+    def render_id(self, row):
+        return row['id']
+
+    def render_name(self, row):
+        return row['name']
+
+    def render_url(self, row):
+        return self.url_template.format(row['task_list_id'], row['id'])
+
+    def render_creator(self, row):
+        return row['creator__username']
+
+    def render_done(self, row):
+        return row['done']
+
+    def render_due_at(self, row):
+        return self.datetime_field.to_representation(row['due_at'])
+
+    def render_task_reminder(self, row):
+        return True if row['taskreminder__id'] is not None else None
+
+    def render_reminder(self, row):
+        if row['taskreminder__id'] is None:
+            return None
+        return OrderedDict([
+            ('status', row['taskreminder__status']),
+            ('sent_at', self.datetime_field.to_representation(row['taskreminder__sent_at'])),
+            ('attempts', row['taskreminder__attempts']),
+        ])
+
+    def render_list(self, row):
+        return row['task_list_id']
+
+    def to_representation(self, row):
+        """Map a values() row to the serializer output, dropping null fields like TaskSerializer"""
+        result = OrderedDict()
+        for field, render in self.renderers:
+            value = render(row)
+            if value is not None:
+                result[field] = value
+        return result
+
+    def serialize(self, queryset):
+        return [self.to_representation(row) for row in queryset.values(*self.get_columns())]
+
+
+def bootstrap_document(lists, request):
+    """
+    Return a page of lists with their items and members as one normalized document.
+    Lists are rows with the shard they live on. Lists refer to items and users by id, and the
+    document costs two queries per shard whatever the number of lists, items or members.
+    """
+    shards = OrderedDict()
+    for task_list in lists:
+        shards.setdefault(task_list['shard'], []).append(task_list['id'])
+    users = OrderedDict((task_list['owner_id'], task_list['owner__username']) for task_list in lists)
+    item_ids = OrderedDict((task_list['id'], []) for task_list in lists)
+    member_ids = OrderedDict((task_list['id'], []) for task_list in lists)
+    rows = ItemRowSerializer(TaskSerializer.Meta.fields + ('list',), request=request)
+    items = []
+    for alias, list_ids in shards.items():
+        items.extend(rows.serialize(
+            TaskItem.objects.using(alias).filter(task_list_id__in=list_ids).order_by('task_list_id', 'rank', 'id')
+        ))
+        memberships = TaskList.members.through.objects.using(alias).filter(tasklist_id__in=list_ids).order_by('id')
+        for membership in memberships.values('tasklist_id', 'user_id', 'user__username'):
+            member_ids[membership['tasklist_id']].append(membership['user_id'])
+            users[membership['user_id']] = membership['user__username']
+    for item in items:
+        item_ids[item['list']].append(item['id'])
+    return OrderedDict([
+        ('lists', [OrderedDict([
+            ('id', task_list['id']),
+            ('name', task_list['name']),
+            ('url', reverse('tasklist-detail', kwargs={'list_pk': task_list['id']}, request=request)),
+            ('owner', task_list['owner_id']),
+            ('items', item_ids[task_list['id']]),
+            ('members', member_ids[task_list['id']]),
+        ]) for task_list in lists]),
+        ('items', items),
+        ('users', [OrderedDict([('id', user_id), ('username', username)]) for user_id, username in users.items()]),
+    ])
+
+
+@lru_cache(maxsize=None)
+def item_permission_choices():
+    """Permissions that can be granted on an item, queried on first use instead of at import"""
+    return tuple((perm.codename, perm.name) for perm in get_perms_for_model(TaskItem))
+
+
 class ItemPermissionSerializer(serializers.Serializer):
-    permission = serializers.ChoiceField(choices=[(perm.codename, perm.name) for perm in get_perms_for_model(TaskItem)])
     list_member = serializers.IntegerField(required=True)
 
+    def get_fields(self):
+        fields = OrderedDict([('permission', serializers.ChoiceField(choices=item_permission_choices()))])
+        fields.update(super().get_fields())
+        return fields
+
     def validate_list_member(self, value):
         task_list = self.context['task_list']
         try:
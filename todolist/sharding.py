@@ -0,0 +1,285 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.http import JsonResponse
+from guardian.models import UserObjectPermission, GroupObjectPermission
+
+from TaskIt.db_router import SAFE_METHODS
+
+from .models import IdSequence, ListShard, TaskList, TaskItem, TaskReminder
+
+#: models whose rows belong to one list and live on that list's shard
+SHARDED_MODELS = {
+    'todolist.tasklist',
+    'todolist.tasklist_members',
+    'todolist.taskitem',
+    'todolist.taskreminder',
+    'guardian.userobjectpermission',
+    'guardian.groupobjectpermission',
+}
+
+#: models copied to every shard so sharded queries can join them, written on the default database
+REFERENCE_MODELS = {
+    'auth.user',
+    'auth.permission',
+    'contenttypes.contenttype',
+}
+
+#: models that only live on the default database
+DIRECTORY_MODELS = {
+    'todolist.listshard',
+    'todolist.idsequence',
+}
+
+_state = threading.local()
+
+
+def is_sharded():
+    return len(settings.LIST_SHARDS) > 1
+
+
+def locate_list(list_id):
+    """
+    Return the database alias a list lives on and whether it is being moved, read from the directory
+    on the default database so a list just moved is never looked for on a lagging replica.
+    """
+    shards = settings.LIST_SHARDS
+    if len(shards) == 1:
+        return shards[0], False
+    entry = ListShard.objects.using('default').filter(pk=int(list_id)).values_list('alias', 'moving').first()
+    return entry if entry and entry[0] else (shards[0], False)
+
+
+def shard_for_list(list_id):
+    return locate_list(list_id)[0]
+
+
+def moving_list_ids():
+    """Ids of the lists being moved, which periodic tasks leave alone until they are on their new shard"""
+    if not is_sharded():
+        return []
+    return list(ListShard.objects.using('default').filter(moving=True).values_list('id', flat=True))
+
+
+def place_list():
+    """
+    Record a new list in the directory with the shard it will live on and return its id and shard.
+    Lists are spread over the shards by id when they are created and stay there when shards are added.
+    """
+    shards = settings.LIST_SHARDS
+    directory = ListShard.objects.using('default')
+    entry = directory.create(alias=shards[0])
+    alias = shards[entry.pk % len(shards)]
+    if alias != entry.alias:
+        directory.filter(pk=entry.pk).update(alias=alias)
+    return entry.pk, alias
+
+
+def current_shard():
+    return getattr(_state, 'shard', None)
+
+
+def set_current_shard(alias):
+    _state.shard = alias
+
+
+def allocate_ids(model, count=1):
+    """
+    Reserve count consecutive ids for new rows of model on any shard.
+    The first allocation continues after the highest id already saved on every shard.
+    """
+    name = model._meta.label_lower
+    sequences = IdSequence.objects.using('default').filter(name=name)
+    with transaction.atomic(using='default'):
+        if not sequences.update(last=F('last') + count):
+            last = max(model._base_manager.using(alias).aggregate(last=Max('pk'))['last'] or 0
+                       for alias in settings.LIST_SHARDS)
+            try:
+                with transaction.atomic(using='default'):
+                    IdSequence.objects.using('default').create(name=name, last=last + count)
+            except IntegrityError:
+                # another process allocated the first ids meanwhile
+                sequences.update(last=F('last') + count)
+        last = sequences.values_list('last', flat=True).get()
+    return list(range(last - count + 1, last + 1))
+
+
+@contextmanager
+def use_shard(alias):
+    """Route list data queries without an explicit database to alias"""
+    previous = current_shard()
+    set_current_shard(alias)
+    try:
+        yield
+    finally:
+        set_current_shard(previous)
+
+
+class ListShardRouter:
+    """
+    Send list data to the shard of the list being worked on.
+    The shard comes from the instance a query is made from or the list it belongs to,
+    or from the list of the current request.
+    Reference tables are read from the same shard so joins stay on one database.
+    Routing is left to the next router while there is a single shard.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in DIRECTORY_MODELS:
+            return 'default'
+        return self.db_for_model(model, hints)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in DIRECTORY_MODELS:
+            return 'default'
+        if model._meta.label_lower in REFERENCE_MODELS:
+            return None
+        return self.db_for_model(model, hints)
+
+    def db_for_model(self, model, hints):
+        label = model._meta.label_lower
+        if not is_sharded() or (label not in SHARDED_MODELS and label not in REFERENCE_MODELS):
+            return None
+        instance = hints.get('instance')
+        # an unsaved instance takes its database from whichever related object was assigned first
+        if instance is not None and not instance._state.adding and instance._state.db in settings.LIST_SHARDS:
+            return instance._state.db
+        if isinstance(instance, TaskList) and instance.pk is not None:
+            return shard_for_list(instance.pk)
+        if isinstance(instance, TaskItem) and instance.task_list_id is not None:
+            return shard_for_list(instance.task_list_id)
+        if isinstance(instance, TaskReminder) and TaskReminder.item.is_cached(instance):
+            return self.db_for_model(TaskItem, {'instance': instance.item})
+        return current_shard()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if '{}.{}'.format(app_label, model_name) in DIRECTORY_MODELS:
+            return db == 'default'
+        return None
+
+
+class ListShardMiddleware:
+    """
+    Route the queries of a request to the shard of the list in its list_pk url argument.
+    Requests that could write to a list being moved are answered 503 so nothing written is left behind.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        set_current_shard(None)
+        try:
+            return self.get_response(request)
+        finally:
+            set_current_shard(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if is_sharded() and 'list_pk' in view_kwargs:
+            alias, moving = locate_list(view_kwargs['list_pk'])
+            if moving and request.method not in SAFE_METHODS:
+                response = JsonResponse({"message": "This list is being moved, try again shortly."}, status=503)
+                response['Retry-After'] = '5'
+                return response
+            set_current_shard(alias)
+
+
+def replicate_user(sender, instance, using, **kwargs):
+    """Copy a user saved on the default database to every other shard"""
+    if using != 'default' or not is_sharded():
+        return
+    for alias in settings.LIST_SHARDS:
+        if alias != 'default':
+            instance.save(using=alias)
+    instance._state.db = 'default'
+
+
+def delete_replicated_user(sender, instance, using, **kwargs):
+    if using != 'default' or not is_sharded():
+        return
+    for alias in settings.LIST_SHARDS:
+        if alias != 'default':
+            sender.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+def copy_object_permissions(model, source, target, content_type, object_pks):
+    """
+    Copy the object permissions of content_type objects with object_pks to target.
+    Content types and permissions are matched by natural key as their ids can differ between shards.
+    """
+    source_type = ContentType.objects.db_manager(source).get_for_model(content_type)
+    target_type = ContentType.objects.db_manager(target).get_for_model(content_type)
+    codenames = dict(Permission.objects.using(source).filter(content_type=source_type).values_list('id', 'codename'))
+    target_permissions = Permission.objects.using(target).filter(content_type=target_type).select_related(
+        'content_type')
+    target_permissions = {permission.codename: permission for permission in target_permissions}
+    for permission in model.objects.using(source).filter(content_type=source_type,
+                                                         object_pk__in=[str(pk) for pk in object_pks]):
+        permission.pk = None
+        permission.content_type = target_type
+        permission.permission = target_permissions[codenames[permission.permission_id]]
+        permission.save(using=target)
+
+
+def delete_object_permissions(database, content_type, object_pks):
+    content_type = ContentType.objects.db_manager(database).get_for_model(content_type)
+    for model in (UserObjectPermission, GroupObjectPermission):
+        model.objects.using(database).filter(content_type=content_type,
+                                             object_pk__in=[str(pk) for pk in object_pks]).delete()
+
+
+def move_list(list_id, target):
+    """
+    Move a list with its members, items, reminders and object permissions to the target shard.
+    The list is marked as moving first so requests can't write to it and periodic tasks skip it.
+    Everything keeps its id, so urls stay valid and queued reminder mails find their reminder.
+    Returns the number of items moved.
+    """
+    source = shard_for_list(list_id)
+    if source == target:
+        return 0
+    directory = ListShard.objects.using('default')
+    directory.update_or_create(pk=list_id, defaults={'alias': source, 'moving': True})
+    try:
+        task_list = TaskList.objects.using(source).get(pk=list_id)
+        items = list(TaskItem.objects.using(source).filter(task_list_id=list_id).order_by('id'))
+        reminders = {reminder.pk: reminder for reminder in
+                     TaskReminder.objects.using(source).filter(item__task_list_id=list_id)}
+        member_ids = list(task_list.members.values_list('id', flat=True))
+        item_ids = [item.pk for item in items]
+
+        with transaction.atomic(using=target):
+            task_list.save(using=target, force_insert=True)
+            TaskList.members.through.objects.using(target).bulk_create(
+                TaskList.members.through(tasklist_id=list_id, user_id=user_id) for user_id in member_ids
+            )
+            TaskItem.objects.using(target).bulk_create(items)
+            TaskReminder.objects.using(target).bulk_create(reminders.values())
+            for model in (UserObjectPermission, GroupObjectPermission):
+                copy_object_permissions(model, source, target, TaskList, [list_id])
+                copy_object_permissions(model, source, target, TaskItem, item_ids)
+    except Exception:
+        directory.filter(pk=list_id).update(moving=False)
+        raise
+
+    with transaction.atomic(using=source):
+        # mails queued before the move record their delivery on the source until it is deleted
+        delivered = TaskReminder.objects.using(source).select_for_update().filter(item__task_list_id=list_id)
+        for reminder in delivered.values('id', 'status', 'sent_at', 'attempts'):
+            copied = reminders[reminder['id']]
+            if (reminder['status'], reminder['sent_at'], reminder['attempts']) != (
+                    copied.status, copied.sent_at, copied.attempts):
+                TaskReminder.objects.using(target).filter(pk=reminder.pop('id')).update(**reminder)
+        directory.filter(pk=list_id).update(alias=target, moving=False)
+        delete_object_permissions(source, TaskList, [list_id])
+        delete_object_permissions(source, TaskItem, item_ids)
+        TaskList.objects.using(source).filter(pk=list_id).delete()
+    return len(items)
@@ -2,14 +2,23 @@
 from __future__ import absolute_import, unicode_literals
 import string
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils.crypto import get_random_string
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Length
 from django.core import mail
 
 from celery import shared_task
 
 import config
 
+from .models import TaskItem, TaskReminder
+from .ranking import MAX_RANK_LENGTH, spaced_ranks
+from .sharding import moving_list_ids
+
 
 @shared_task
 def create_random_user_accounts(total=10):
@@ -21,11 +30,110 @@ def create_random_user_accounts(total=10):
     return '{} random users created with success!'.format(total)
 
 
-@shared_task
-def send_delayed_mail(subject, recipients, message):
-    mail.send_mail(
-        subject=subject,
-        recipient_list=recipients,
-        message=message,
-        from_email=config.EMAIL_USER
-    )
+def record_delivery(reminder_id, database, **fields):
+    """
+    Update the reminder on database with a single UPDATE, or on the shard its list was moved to
+    after the mail was queued. Reminder ids are unique across shards.
+    """
+    if TaskReminder.objects.using(database).filter(pk=reminder_id).update(**fields):
+        return
+    for alias in settings.LIST_SHARDS:
+        if alias != database and TaskReminder.objects.using(alias).filter(pk=reminder_id).update(**fields):
+            return
+
+
+@shared_task(ignore_result=True)
+def send_delayed_mail(subject, recipients, message, reminder_id=None, database='default'):
+    """Send mail and record the delivery on the reminder, kept on the database given"""
+    try:
+        mail.send_mail(
+            subject=subject,
+            recipient_list=recipients,
+            message=message,
+            from_email=config.EMAIL_USER
+        )
+    except Exception:
+        if reminder_id is not None:
+            record_delivery(reminder_id, database, status=TaskReminder.FAILED, attempts=F('attempts') + 1)
+        raise
+    if reminder_id is not None:
+        record_delivery(reminder_id, database, status=TaskReminder.SENT, sent_at=timezone.now(),
+                        attempts=F('attempts') + 1)
+
+
+@shared_task(bind=True, ignore_result=True)
+def send_account_mail(self, subject, body, from_email, to, html=None, content_subtype='plain'):
+    """
+    Send mail rendered by the account adapter, retrying with exponential backoff from
+    settings.ACCOUNT_MAIL_RETRY_DELAY seconds while the mail server can't be reached.
+    """
+    message = mail.EmailMultiAlternatives(subject, body, from_email, to)
+    message.content_subtype = content_subtype
+    if html:
+        message.attach_alternative(html, 'text/html')
+    try:
+        message.send()
+    except OSError as error:
+        # smtplib and socket errors are both OSErrors
+        raise self.retry(exc=error, countdown=settings.ACCOUNT_MAIL_RETRY_DELAY * 2 ** self.request.retries,
+                         max_retries=settings.ACCOUNT_MAIL_MAX_RETRIES)
+
+
+@shared_task(ignore_result=True)
+def send_due_reminders():
+    """
+    Queue the mail of every recurring reminder that is due on any list shard and move it to its next run.
+    Only due reminders are read through the next_run_at index so a tick costs as much as what fires.
+    Reminders of lists being moved are left to the next tick.
+    """
+    now = timezone.now()
+    moving = moving_list_ids()
+    fired = 0
+    for database in settings.LIST_SHARDS:
+        due = TaskReminder.objects.using(database).filter(next_run_at__lte=now).select_related('item')
+        if moving:
+            due = due.exclude(item__task_list_id__in=moving)
+        for reminder in due.order_by('next_run_at'):
+            # only the tick that moves the run it read sends the mail, overlapping ticks skip it
+            claimed = TaskReminder.objects.using(database).filter(
+                pk=reminder.pk, next_run_at=reminder.next_run_at
+            ).update(next_run_at=reminder.rule.next_after(reminder.next_run_at, now))
+            if claimed != 1:
+                continue
+            send_delayed_mail.delay(
+                subject="Reminder for todo list",
+                recipients=reminder.recipients.split(','),
+                message="Reminder for item {}".format(reminder.item.name),
+                reminder_id=reminder.pk,
+                database=database
+            )
+            fired += 1
+    return fired
+
+
+def rebalance_list(list_id, database='default'):
+    """Give the items of a list short evenly spaced ranks, keeping their order"""
+    items = TaskItem.objects.using(database).filter(task_list_id=list_id)
+    with transaction.atomic(using=database):
+        item_ids = list(items.select_for_update().order_by('rank', 'id').values_list('id', flat=True))
+        for item_id, rank in zip(item_ids, spaced_ranks(len(item_ids))):
+            items.filter(pk=item_id).update(rank=rank)
+
+
+@shared_task(ignore_result=True)
+def rebalance_ranks():
+    """
+    Renormalize the ranks of every list, on any list shard, that has grown a rank longer than MAX_RANK_LENGTH.
+    Moves only write one rank each, repeated moves into the same gap make ranks longer until this runs.
+    """
+    moving = moving_list_ids()
+    rebalanced = 0
+    for database in settings.LIST_SHARDS:
+        long_ranks = TaskItem.objects.using(database).annotate(
+            rank_length=Length('rank')).filter(rank_length__gt=MAX_RANK_LENGTH)
+        if moving:
+            long_ranks = long_ranks.exclude(task_list_id__in=moving)
+        for list_id in long_ranks.order_by('task_list_id').values_list('task_list_id', flat=True).distinct():
+            rebalance_list(list_id, database)
+            rebalanced += 1
+    return rebalanced
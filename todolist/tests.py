@@ -1,11 +1,40 @@
 
+import gzip
 import json
+import os
+import smtplib
+import tempfile
+import time
+from unittest import skipIf
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.auth.models import Permission
 from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.db import connection, connections
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase, APIRequestFactory
+from rest_framework.request import Request
+from rest_framework.renderers import JSONRenderer
 from guardian.shortcuts import assign_perm
-from .models import User, TaskList, TaskItem
-from .tasks import create_random_user_accounts
+from celery.signals import task_prerun, task_postrun
+from .models import User, TaskList, TaskItem, TaskReminder, ListShard
+from .tasks import (create_random_user_accounts, send_due_reminders, rebalance_ranks, send_account_mail,
+                    send_delayed_mail)
+from .recurrence import compile_rule
+from .authentication import user_cache_key
+from .renderers import FastJSONRenderer, accepts_gzip, orjson
+from .ranking import rank_between, spaced_ranks, MAX_RANK_LENGTH
+from .serializers import ItemRowSerializer, TaskSerializer, CreateTaskSerializer
+from .sharding import shard_for_list, move_list
+from .management.commands.bench_startup import STARTUP_COMMANDS, STARTUP_BUDGETS, time_startup
+from TaskIt.db_router import (PrimaryReplicaRouter, unpin_primary, enter_pinning_scope, exit_pinning_scope,
+                              is_pinned)
+from TaskIt.celery import app as celery_app, TASK_QUEUES
 
 # Create your tests here.
 
@@ -56,6 +85,18 @@ class TaskListViewTest(APITestCase):
         response = self.client.get('/lists/1/')
         self.assertTrue('/lists/1/items/1/' in response.data['tasks'][0])
 
+    def test_list_view_stranger_forbidden(self):
+        """A user who neither owns nor belongs to a list can't read it or expand its items and members"""
+        TaskItem.objects.create(name="first list item", creator=self.user, task_list=self.my_list)
+        self.client.force_authenticate(user=User.objects.create_user('pete', 'fake3@fake.com', 'password'))
+        self.assertEqual(403, self.client.get('/lists/1/?expand=items,members').status_code)
+
+    def test_list_view_member(self):
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        self.my_list.members.add(mary)
+        self.client.force_authenticate(user=mary)
+        self.assertEqual(200, self.client.get('/lists/1/?expand=items,members').status_code)
+
 
 class TaskViewTest(APITestCase):
     """Tests Task view"""
@@ -179,6 +220,99 @@ class ListMembersViewTest(APITestCase):
         response = self.client.post('/lists/1/members/', data={'email': user2.email})
         self.assertEqual(201, response.status_code)
 
+    def test_list_members_view_is_paginated(self):
+        """/lists/<list_id>/members/ should return members one page at a time"""
+        for i in range(3):
+            self.my_list.members.add(User.objects.create_user('user{}'.format(i), 'user{}@test.com'.format(i), 'pw'))
+        response = self.client.get('/lists/1/members/?page_size=2')
+        self.assertEqual(3, response.data['count'])
+        self.assertEqual(['user0', 'user1'], [member['username'] for member in response.data['results']])
+        self.assertTrue(response.data['next'])
+
+    def test_list_members_view_bulk_post(self):
+        """post request with many emails and ids should add them all and report unknown and existing members"""
+        users = [User.objects.create_user('user{}'.format(i), 'user{}@test.com'.format(i), 'pw') for i in range(4)]
+        self.my_list.members.add(users[0])
+        data = {'emails': ['user0@test.com', 'user1@test.com', 'nobody@test.com'], 'ids': [users[2].id, users[3].id, 999]}
+        # list lookup for the permission check, list, users, existing members, savepoint, insert, release savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post('/lists/1/members/', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(['user1', 'user2', 'user3'], sorted(user['username'] for user in response.data['added']))
+        self.assertEqual(['user0'], [user['username'] for user in response.data['already_members']])
+        self.assertEqual({'emails': ['nobody@test.com'], 'ids': [999]}, response.data['unknown'])
+        self.assertEqual(4, self.my_list.members.count())
+
+    def test_list_members_view_invalid_users(self):
+        """Malformed emails and ids should be reported field by field"""
+        data = json.dumps({'emails': ['not an email'], 'ids': ['one']})
+        for method in (self.client.post, self.client.delete):
+            response = method('/lists/1/members/', data=data, content_type='application/json')
+            self.assertEqual(400, response.status_code)
+            self.assertEqual({'emails', 'ids'}, set(response.data))
+        response = self.client.post('/lists/1/members/', data={})
+        self.assertEqual(["Email or id of a user required."], response.data['non_field_errors'])
+
+    def test_list_members_view_concurrent_add(self):
+        """A user added by another request between the lookup and the insert is reported as already a member"""
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        through = TaskList.members.through
+        lookup = through.objects.filter
+        lookups = []
+
+        def concurrent_add(**kwargs):
+            lookups.append(kwargs)
+            if len(lookups) > 1:
+                return lookup(**kwargs)
+            # the other request inserts right after this one read the existing members
+            through.objects.create(tasklist_id=self.my_list.id, user_id=mary.id)
+            return lookup(**kwargs).none()
+
+        with patch.object(through.objects, 'filter', side_effect=concurrent_add):
+            response = self.client.post('/lists/1/members/', data={'email': mary.email})
+        self.assertEqual(2, len(lookups))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['mary'], [user['username'] for user in response.data['already_members']])
+        self.assertEqual([mary], list(self.my_list.members.all()))
+
+    def test_list_members_view_post_unknown_email(self):
+        """post request for an email that matches no user should return 404"""
+        response = self.client.post('/lists/1/members/', data={'email': 'nobody@test.com'})
+        self.assertEqual(404, response.status_code)
+
+    def test_list_members_view_bulk_delete(self):
+        """delete request with many ids should remove them and report who was not a member"""
+        users = [User.objects.create_user('user{}'.format(i), 'user{}@test.com'.format(i), 'pw') for i in range(3)]
+        self.my_list.members.add(users[0], users[1])
+        data = {'ids': [users[0].id, users[1].id, users[2].id]}
+        response = self.client.delete('/lists/1/members/', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['user0', 'user1'], sorted(user['username'] for user in response.data['removed']))
+        self.assertEqual(['user2'], [user['username'] for user in response.data['not_members']])
+        self.assertFalse(self.my_list.members.exists())
+
+    def test_list_members_view_stranger_forbidden(self):
+        """A user who neither owns nor belongs to the list can't list, add or remove its members"""
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        self.my_list.members.add(mary)
+        stranger = User.objects.create_user('pete', 'fake3@fake.com', 'password')
+        self.client.force_authenticate(user=stranger)
+        data = json.dumps({'ids': [mary.id]})
+        self.assertEqual(403, self.client.get('/lists/1/members/').status_code)
+        self.assertEqual(403, self.client.post('/lists/1/members/', data={'email': stranger.email}).status_code)
+        self.assertEqual(403, self.client.delete('/lists/1/members/', data=data, content_type='application/json').status_code)
+        self.assertEqual([mary], list(self.my_list.members.all()))
+
+    def test_list_members_view_member_cannot_remove(self):
+        """Only the owner can remove members"""
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        self.my_list.members.add(mary)
+        self.client.force_authenticate(user=mary)
+        response = self.client.delete('/lists/1/members/', data=json.dumps({'ids': [mary.id]}),
+                                      content_type='application/json')
+        self.assertEqual(403, response.status_code)
+        self.assertTrue(self.my_list.members.exists())
+
 
 class CreateTaskReminderViewTest(BaseTestCase):
 
@@ -203,6 +337,76 @@ class CreateTaskReminderViewTest(BaseTestCase):
         self.assertEqual("Reminder created", response.data['message'])
         self.assertEqual(1, len(mail.outbox))
 
+    def test_create_reminder_broker_down(self):
+        """A reminder whose mail can't be queued should not be left behind to block the retry"""
+        url = '/lists/1/items/{}/reminder/'.format(self.item.id)
+        data = json.dumps({"schedule": {"minutes": 1}})
+        with patch.object(send_delayed_mail, 'apply_async', side_effect=OSError("broker unreachable")):
+            with self.assertRaises(OSError):
+                self.client.post(url, data=data, content_type='application/json')
+        self.assertFalse(TaskReminder.objects.exists())
+        with patch.object(send_delayed_mail, 'apply_async'):
+            response = self.client.post(url, data=data, content_type='application/json')
+        self.assertEqual(201, response.status_code)
+
+    @override_settings(
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+        CELERY_ALWAYS_EAGER=True,
+        BROKER_BACKEND='memory',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_create_reminder_query_count(self):
+        """Creating a reminder should look up item, owner and recipients in one query then insert the reminder"""
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        pete = User.objects.create_user('pete', 'fake3@fake.com', 'password')
+        self.my_list.members.add(mary, pete)
+        # recipients select, savepoint, insert, release savepoint, delivery status update by the eager task
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                '/lists/1/items/{}/reminder/'.format(self.item.id),
+                data=json.dumps({"schedule": {"minutes": 1}, "recipients": [mary.id]}),
+                content_type='application/json'
+            )
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(['fake2@fake.com', 'fake@test.com'], sorted(mail.outbox[0].to))
+
+    @override_settings(
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+        CELERY_ALWAYS_EAGER=True,
+        BROKER_BACKEND='memory',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_create_duplicate_reminder(self):
+        """Creating a second reminder for an item should return 400 without sending mail"""
+        url = '/lists/1/items/{}/reminder/'.format(self.item.id)
+        data = json.dumps({"schedule": {"minutes": 1}})
+        self.client.post(url, data=data, content_type='application/json')
+        response = self.client.post(url, data=data, content_type='application/json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(1, len(mail.outbox))
+
+    @override_settings(
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+        CELERY_ALWAYS_EAGER=True,
+        BROKER_BACKEND='memory',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_reminder_delivery_status(self):
+        """Sending a reminder should mark it sent and the item should show the delivery status"""
+        self.client.post(
+            '/lists/1/items/{}/reminder/'.format(self.item.id),
+            data=json.dumps({"schedule": {"minutes": 1}}),
+            content_type='application/json'
+        )
+        reminder = TaskReminder.objects.get(item=self.item)
+        self.assertEqual(TaskReminder.SENT, reminder.status)
+        self.assertEqual(1, reminder.attempts)
+        self.assertTrue(reminder.sent_at)
+        response = self.client.get('/lists/1/items/{}/'.format(self.item.id))
+        self.assertTrue(response.data['task_reminder'])
+        self.assertEqual('sent', response.data['reminder']['status'])
+        self.assertEqual(1, response.data['reminder']['attempts'])
+
     def test_create_reminder_with_bad_item_id(self):
         response = self.client.post(
             '/lists/1/items/255555/reminder/',
@@ -220,6 +424,831 @@ class CreateTaskReminderViewTest(BaseTestCase):
         self.assertEqual(404, response.status_code)
 
 
+class RecurrenceRuleTest(SimpleTestCase):
+
+    def test_interval_rule_skips_missed_runs(self):
+        rule = compile_rule(timezone.timedelta(hours=1), '')
+        last_run = timezone.datetime(2017, 10, 1, 9, 0, tzinfo=timezone.utc)
+        now = timezone.datetime(2017, 10, 1, 12, 30, tzinfo=timezone.utc)
+        self.assertEqual(timezone.datetime(2017, 10, 1, 13, 0, tzinfo=timezone.utc), rule.next_after(last_run, now))
+
+    def test_cron_rule_next_weekday(self):
+        """'0 9 * * 1-5' should fire at nine on the next weekday"""
+        rule = compile_rule(None, '0 9 * * 1-5')
+        # friday 2017-10-06 at ten, next run is monday
+        friday = timezone.datetime(2017, 10, 6, 10, 0, tzinfo=timezone.utc)
+        self.assertEqual(timezone.datetime(2017, 10, 9, 9, 0, tzinfo=timezone.utc), rule.next_after(friday))
+
+    def test_cron_rule_is_compiled_once(self):
+        self.assertIs(compile_rule(None, '*/15 * * * *'), compile_rule(None, '*/15 * * * *'))
+
+    def test_bad_cron_rule(self):
+        with self.assertRaises(ValueError):
+            compile_rule(None, '61 * * * *')
+
+
+class RecurringReminderTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.item = TaskItem.objects.create(creator=self.user, name="first list item", task_list=self.my_list)
+
+    def test_create_recurring_reminder(self):
+        """A reminder with repeat_cron should be stored with its first run and no celery task"""
+        response = self.client.post(
+            '/lists/1/items/{}/reminder/'.format(self.item.id),
+            data=json.dumps({"schedule": {"hours": 1}, "repeat_cron": "0 9 * * *"}),
+            content_type='application/json'
+        )
+        self.assertEqual(201, response.status_code)
+        reminder = TaskReminder.objects.get(item=self.item)
+        self.assertEqual('0 9 * * *', reminder.cron)
+        self.assertEqual('fake@test.com', reminder.recipients)
+        self.assertEqual('', reminder.task_id)
+        self.assertTrue(reminder.next_run_at > timezone.now())
+        # the first run after the schedule that matches the cron expression
+        self.assertEqual((9, 0), (reminder.next_run_at.hour, reminder.next_run_at.minute))
+
+    def test_create_recurring_reminder_empty_interval(self):
+        response = self.client.post(
+            '/lists/1/items/{}/reminder/'.format(self.item.id),
+            data=json.dumps({"schedule": {"hours": 1}, "repeat_every": {}}),
+            content_type='application/json'
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(["repeat_every needs a duration"], response.data['non_field_errors'])
+        self.assertFalse(TaskReminder.objects.exists())
+
+    def test_create_recurring_reminder_bad_cron(self):
+        response = self.client.post(
+            '/lists/1/items/{}/reminder/'.format(self.item.id),
+            data=json.dumps({"schedule": {"hours": 1}, "repeat_cron": "0 25 * * *"}),
+            content_type='application/json'
+        )
+        self.assertEqual(400, response.status_code)
+
+    @override_settings(
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+        CELERY_ALWAYS_EAGER=True,
+        BROKER_BACKEND='memory',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_send_due_reminders(self):
+        """A tick should only send due reminders and move them to their next run"""
+        now = timezone.now()
+        due = TaskReminder.objects.create(
+            item=self.item, creator=self.user, interval=timezone.timedelta(days=1),
+            next_run_at=now - timezone.timedelta(minutes=1), recipients='fake@test.com'
+        )
+        later_item = TaskItem.objects.create(creator=self.user, name="second list item", task_list=self.my_list)
+        TaskReminder.objects.create(
+            item=later_item, creator=self.user, interval=timezone.timedelta(days=1),
+            next_run_at=now + timezone.timedelta(hours=1), recipients='fake@test.com'
+        )
+        # select due reminders, next run update, delivery status update by the eager task
+        with self.assertNumQueries(3):
+            self.assertEqual(1, send_due_reminders())
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual('Reminder for item first list item', mail.outbox[0].body)
+        due.refresh_from_db()
+        self.assertTrue(due.next_run_at > now)
+
+    @override_settings(
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+        CELERY_ALWAYS_EAGER=True,
+        BROKER_BACKEND='memory',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_overlapping_ticks_send_once(self):
+        """A reminder another tick moved after this one read it should not be sent again"""
+        now = timezone.now()
+        second_item = TaskItem.objects.create(creator=self.user, name="second list item", task_list=self.my_list)
+        reminders = [TaskReminder.objects.create(
+            item=item, creator=self.user, interval=timezone.timedelta(days=1),
+            next_run_at=now - timezone.timedelta(minutes=minutes), recipients='fake@test.com'
+        ) for item, minutes in ((self.item, 2), (second_item, 1))]
+        send = send_delayed_mail.delay
+
+        def other_tick(**kwargs):
+            # the other tick claims the second reminder while this one sends the first
+            TaskReminder.objects.filter(pk=reminders[1].pk).update(next_run_at=now + timezone.timedelta(days=1))
+            return send(**kwargs)
+
+        with patch.object(send_delayed_mail, 'delay', side_effect=other_tick):
+            self.assertEqual(1, send_due_reminders())
+        self.assertEqual(['Reminder for item first list item'], [message.body for message in mail.outbox])
+
+
+class ItemRowSerializerTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        for i in range(5):
+            TaskItem.objects.create(name="list item {}".format(i), creator=mary if i % 2 else self.user,
+                                    task_list=self.my_list, done=i == 3)
+        TaskReminder.objects.create(item_id=2, creator=self.user, task_id='abc')
+        TaskReminder.objects.create(item_id=4, creator=self.user, status=TaskReminder.SENT, attempts=1,
+                                    sent_at=timezone.now())
+        self.request = Request(APIRequestFactory().get('/lists/1/items/'))
+
+    def assert_same_json(self, serializer_class):
+        queryset = TaskItem.objects.filter(task_list=self.my_list).order_by('id')
+        expected = serializer_class(queryset, many=True, context={'request': self.request}).data
+        rows = ItemRowSerializer(serializer_class.Meta.fields, request=self.request)
+        with self.assertNumQueries(1):
+            fast = rows.serialize(queryset)
+        self.assertEqual(JSONRenderer().render(expected), JSONRenderer().render(fast))
+
+    def test_same_output_as_task_serializer(self):
+        self.assert_same_json(TaskSerializer)
+
+    def test_same_output_as_create_task_serializer(self):
+        self.assert_same_json(CreateTaskSerializer)
+
+    def test_item_listing_query_count(self):
+        """Listing items should render every item from a single query"""
+        # list lookup for the permission check, then the items
+        with self.assertNumQueries(2):
+            response = self.client.get('/lists/1/items/')
+        self.assertEqual(5, len(response.data))
+        self.assertTrue(response.data[0]['url'].endswith('/lists/1/items/1/'))
+
+
+class RankingTest(SimpleTestCase):
+
+    def test_rank_between_sorts_between(self):
+        for before, after in (('', ''), ('', 'i001'), ('i001', ''), ('a', 'b'), ('0001', '0002'), ('zzzz', '')):
+            rank = rank_between(before, after)
+            self.assertTrue(before < rank and (not after or rank < after), (before, rank, after))
+            self.assertFalse(rank.endswith('0'))
+
+    def test_appending_keeps_ranks_short(self):
+        ranks = ['']
+        for i in range(1000):
+            ranks.append(rank_between(ranks[-1], ''))
+        self.assertEqual(sorted(ranks), ranks)
+        self.assertEqual(4, len(ranks[-1]))
+
+    def test_spaced_ranks(self):
+        ranks = spaced_ranks(5000)
+        self.assertEqual(sorted(set(ranks)), ranks)
+        self.assertTrue(all(len(rank) <= 5 for rank in ranks))
+
+
+class ItemOrderTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(4):
+            self.my_list.tasks.create(name="item {}".format(i), creator=self.user)
+
+    def listed_ids(self):
+        return [item['id'] for item in self.client.get('/lists/1/items/').data]
+
+    def test_new_items_are_appended(self):
+        self.assertEqual([1, 2, 3, 4], self.listed_ids())
+
+    def test_bulk_created_items_are_appended(self):
+        TaskItem.objects.bulk_create(
+            TaskItem(name="bulk item {}".format(i), creator=self.user, task_list=self.my_list) for i in range(2)
+        )
+        self.assertEqual([1, 2, 3, 4, 5, 6], self.listed_ids())
+        self.assertEqual(200, self.client.patch('/lists/1/items/5/', data={'done': True}).status_code)
+        self.assertEqual([1, 2, 3, 4, 5, 6], self.listed_ids())
+
+    def test_editing_item_keeps_its_place(self):
+        TaskItem.objects.filter(pk=2).update(rank='')
+        self.client.patch('/lists/1/items/2/', data={'name': 'renamed'})
+        self.assertEqual('', TaskItem.objects.get(pk=2).rank)
+
+    def test_move_item_updates_one_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/lists/1/items/4/move/', data={'after': 1})
+        self.assertEqual(200, response.status_code)
+        writes = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith('SELECT')]
+        self.assertEqual(1, len(writes))
+        self.assertTrue(writes[0].startswith('UPDATE'))
+        self.assertEqual([1, 4, 2, 3], self.listed_ids())
+
+    def test_move_item_to_top(self):
+        response = self.client.post('/lists/1/items/3/move/', data=json.dumps({'after': None}),
+                                    content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([3, 1, 2, 4], self.listed_ids())
+
+    def test_move_after_item_of_another_list(self):
+        other = TaskList.objects.create(owner=self.user, name="other list")
+        other.tasks.create(name="other item", creator=self.user)
+        response = self.client.post('/lists/1/items/2/move/', data={'after': 5})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([1, 2, 3, 4], self.listed_ids())
+
+    def test_list_detail_links_items_in_order(self):
+        self.client.post('/lists/1/items/1/move/', data={'after': 3})
+        tasks = self.client.get('/lists/1/').data['tasks']
+        self.assertEqual(['/lists/1/items/{}/'.format(pk) for pk in (2, 3, 1, 4)],
+                         [url[url.index('/lists/'):] for url in tasks])
+
+    def test_rebalance_long_ranks(self):
+        """Moving items into the same gap grows ranks until rebalance_ranks shortens them, keeping the order"""
+        for i in range(100):
+            self.client.post('/lists/1/items/{}/move/'.format(2 if i % 2 else 3), data={'after': 1})
+        order = self.listed_ids()
+        self.assertTrue(any(len(item.rank) > MAX_RANK_LENGTH for item in TaskItem.objects.all()))
+        self.assertEqual(1, rebalance_ranks())
+        self.assertEqual(order, self.listed_ids())
+        self.assertTrue(all(len(item.rank) <= MAX_RANK_LENGTH for item in TaskItem.objects.all()))
+        self.assertEqual(0, rebalance_ranks())
+
+
+class SparseFieldsTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        self.my_list.members.add(self.mary)
+        self.item = TaskItem.objects.create(name="first list item", creator=self.user, task_list=self.my_list)
+
+    def test_item_sparse_fields(self):
+        """?fields= should only render and query the requested fields"""
+        # list permission check, then the item with its list joined and nothing for creator or reminder
+        with self.assertNumQueries(2):
+            response = self.client.get('/lists/1/items/1/?fields=id,name,done')
+        self.assertEqual({'id': 1, 'name': 'first list item', 'done': False}, response.data)
+
+    def test_item_all_fields_query_count(self):
+        """An item with every field should be read with one joined query after the list permission check"""
+        with self.assertNumQueries(2):
+            response = self.client.get('/lists/1/items/1/')
+        self.assertEqual('tom', response.data['creator'])
+
+    def test_list_sparse_fields(self):
+        """?fields= on a list should skip the item hyperlinks"""
+        # list lookup for the permission check, then the list
+        with self.assertNumQueries(2):
+            response = self.client.get('/lists/1/?fields=id,name')
+        self.assertEqual({'id': 1, 'name': 'my first playlist'}, response.data)
+
+    def test_list_expand(self):
+        """?expand= should render items and members of a list"""
+        response = self.client.get('/lists/1/?expand=items,members')
+        self.assertEqual([{'id': 1, 'name': 'first list item', 'creator': 'tom', 'done': False}],
+                         response.data['items'])
+        self.assertEqual([{'id': self.mary.id, 'username': 'mary'}], response.data['members'])
+        self.assertEqual(1, len(response.data['tasks']))
+
+    def test_item_listing_fields_and_expand(self):
+        response = self.client.get('/lists/1/items/?fields=id,name,creator&expand=creator')
+        self.assertEqual([{'id': 1, 'name': 'first list item', 'creator': 'tom'}], response.data)
+
+    def test_item_listing_fields_are_requested(self):
+        """Fields named in ?fields= are rendered without ?expand="""
+        response = self.client.get('/lists/1/items/?fields=id,name,done')
+        self.assertEqual([{'id': 1, 'name': 'first list item', 'done': False}], response.data)
+        response = self.client.get('/lists/1/items/?fields=id,creator')
+        self.assertEqual([{'id': 1, 'creator': 'tom'}], response.data)
+        response = self.client.get('/lists/1/items/')
+        self.assertNotIn('done', response.data[0])
+
+    def test_sparse_fields_do_not_skip_validation(self):
+        """?fields= only narrows the output of a create, every field is still validated and saved"""
+        response = self.client.post('/lists/1/items/?fields=id', data={'name': 'x'})
+        self.assertEqual(201, response.status_code)
+        self.assertEqual({'id': 2}, response.data)
+        self.assertEqual('x', TaskItem.objects.get(pk=2).name)
+        response = self.client.post('/lists/1/items/?fields=id', data={})
+        self.assertEqual(400, response.status_code)
+        self.assertIn('name', response.data)
+
+    def test_members_sparse_fields(self):
+        response = self.client.get('/lists/1/members/?fields=username')
+        self.assertEqual([{'username': 'mary'}], response.data['results'])
+
+
+class BootstrapViewTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        self.my_list.members.add(self.mary)
+        self.marys_list = TaskList.objects.create(owner=self.mary, name="mary's list")
+        self.marys_list.members.add(self.user)
+        TaskItem.objects.create(name="first list item", creator=self.user, task_list=self.my_list)
+        TaskItem.objects.create(name="mary's item", creator=self.mary, task_list=self.marys_list)
+
+    def test_bootstrap_document(self):
+        """/bootstrap/ should return owned and shared lists with their items and members"""
+        response = self.client.get('/bootstrap/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, response.data['count'])
+        lists = response.data['results']['lists']
+        self.assertEqual([self.my_list.id, self.marys_list.id], [task_list['id'] for task_list in lists])
+        self.assertEqual([1], lists[0]['items'])
+        self.assertEqual([self.mary.id], lists[0]['members'])
+        self.assertEqual([self.user.id], lists[1]['members'])
+        self.assertEqual({'id': 2, 'name': "mary's item", 'creator': 'mary', 'done': False, 'list': self.marys_list.id},
+                         response.data['results']['items'][1])
+        self.assertEqual(['tom', 'mary'], [user['username'] for user in response.data['results']['users']])
+
+    def test_bootstrap_query_count_is_fixed(self):
+        """The number of queries should not grow with lists, items or members"""
+        for i in range(10):
+            task_list = TaskList.objects.create(owner=self.user, name="list {}".format(i))
+            task_list.members.add(self.mary)
+            for j in range(5):
+                TaskItem.objects.create(name="item {}".format(j), creator=self.mary, task_list=task_list)
+        # count of lists, page of lists, items, memberships
+        with self.assertNumQueries(4):
+            response = self.client.get('/bootstrap/')
+        self.assertEqual(12, len(response.data['results']['lists']))
+        self.assertEqual(52, len(response.data['results']['items']))
+
+    def test_bootstrap_pages(self):
+        for i in range(3):
+            TaskList.objects.create(owner=self.user, name="list {}".format(i))
+        response = self.client.get('/bootstrap/?page=2&page_size=2')
+        self.assertEqual(5, response.data['count'])
+        self.assertEqual(["list 0", "list 1"], [task_list['name'] for task_list in response.data['results']['lists']])
+
+    def test_bootstrap_conditional_get(self):
+        """Asking again with the ETag should return 304 Not Modified"""
+        response = self.client.get('/bootstrap/')
+        response = self.client.get('/bootstrap/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+
+
+class AgendaViewTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        pete = User.objects.create_user('pete', 'fake3@fake.com', 'password')
+        marys_list = TaskList.objects.create(owner=mary, name="mary's list")
+        marys_list.members.add(self.user)
+        # owning a list and being a member of it should not list its items twice
+        self.my_list.members.add(self.user)
+        petes_list = TaskList.objects.create(owner=pete, name="pete's list")
+        self.tomorrow = self.my_list.tasks.create(name="tomorrow", creator=self.user, due_at=self.now + timezone.timedelta(days=1))
+        self.overdue = marys_list.tasks.create(name="overdue", creator=mary, due_at=self.now - timezone.timedelta(days=1))
+        self.in_two_days = marys_list.tasks.create(name="in two days", creator=mary, due_at=self.now + timezone.timedelta(days=2))
+        self.my_list.tasks.create(name="next month", creator=self.user, due_at=self.now + timezone.timedelta(days=30))
+        self.my_list.tasks.create(name="done", creator=self.user, done=True, due_at=self.now + timezone.timedelta(days=1))
+        self.my_list.tasks.create(name="no due date", creator=self.user)
+        petes_list.tasks.create(name="not my list", creator=pete, due_at=self.now + timezone.timedelta(days=1))
+
+    def test_agenda_lists_items_due_this_week_across_lists(self):
+        response = self.client.get('/agenda/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([self.overdue.id, self.tomorrow.id, self.in_two_days.id],
+                         [item['id'] for item in response.data['results']])
+        self.assertEqual({'id', 'name', 'url', 'due_at', 'list'}, set(response.data['results'][0]))
+        self.assertIsNone(response.data['next'])
+
+    def test_agenda_window(self):
+        response = self.client.get('/agenda/', {'since': self.now.isoformat(),
+                                                'until': (self.now + timezone.timedelta(days=60)).isoformat()})
+        self.assertEqual(["tomorrow", "in two days", "next month"], [item['name'] for item in response.data['results']])
+
+    def test_agenda_keyset_pagination(self):
+        """Every page should take one query and the pages should add up to the whole agenda"""
+        names = []
+        url = '/agenda/?page_size=1'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            names.extend(item['name'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(["overdue", "tomorrow", "in two days"], names)
+
+    def test_create_item_with_due_date(self):
+        due_at = self.now + timezone.timedelta(days=3)
+        response = self.client.post('/lists/1/items/', data={'name': 'new item', 'due_at': due_at.isoformat()})
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(due_at, TaskItem.objects.get(pk=response.data['id']).due_at)
+
+    def test_agenda_invalid_cursor(self):
+        self.assertEqual(404, self.client.get('/agenda/', {'cursor': 'nonsense'}).status_code)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+
+    def tearDown(self):
+        unpin_primary()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual('replica', PrimaryReplicaRouter().db_for_read(TaskItem))
+
+    def test_writes_pin_reads_to_primary(self):
+        router = PrimaryReplicaRouter()
+        enter_pinning_scope()
+        try:
+            self.assertEqual('default', router.db_for_write(TaskItem))
+            self.assertEqual('default', router.db_for_read(TaskItem))
+        finally:
+            exit_pinning_scope()
+        self.assertEqual('replica', router.db_for_read(TaskItem))
+
+    def test_writes_outside_requests_and_tasks_dont_pin(self):
+        """A worker or command thread should not stay on the primary for the rest of the process"""
+        router = PrimaryReplicaRouter()
+        self.assertEqual('default', router.db_for_write(TaskItem))
+        self.assertEqual('replica', router.db_for_read(TaskItem))
+
+    def test_celery_tasks_are_pinning_scopes(self):
+        task_prerun.send(sender=None)
+        PrimaryReplicaRouter().db_for_write(TaskItem)
+        self.assertTrue(is_pinned())
+        task_postrun.send(sender=None)
+        self.assertFalse(is_pinned())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual('default', PrimaryReplicaRouter().db_for_read(TaskItem))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class DatabaseRoutingTest(APITransactionTestCase):
+    """The replica is a test mirror of the primary so both see committed rows"""
+    multi_db = True
+
+    def setUp(self):
+        make_data(self)
+        self.client.force_authenticate(user=self.user)
+        self.url = '/lists/{}/items/'.format(self.my_list.id)
+
+    def tearDown(self):
+        unpin_primary()
+
+    def test_get_reads_from_replica(self):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, len(primary.captured_queries))
+        self.assertEqual(2, len(replica.captured_queries))
+        self.assertNotIn('pin_primary', response.cookies)
+
+    def test_write_pins_client_to_primary(self):
+        """After a write the client should read its own writes from the primary"""
+        response = self.client.post(self.url, data={'name': 'my first list item'})
+        self.assertEqual(201, response.status_code)
+        self.assertIn('pin_primary', response.cookies)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(self.url)
+        self.assertEqual(1, len(response.data))
+        self.assertEqual(0, len(replica.captured_queries))
+
+
+@override_settings(LIST_SHARDS=['default', 'shard1'])
+class ListShardTest(BaseTestCase):
+    multi_db = True
+
+    def setUp(self):
+        super().setUp()
+        self.mary = User.objects.create_user('mary', 'fake2@fake.com', 'password')
+        self.other_list = TaskList.objects.create(owner=self.user, name="second list")
+        self.lists_by_shard = {shard_for_list(self.my_list.id): self.my_list, shard_for_list(self.other_list.id): self.other_list}
+
+    def test_lists_are_spread_over_shards(self):
+        """Consecutive list ids should hash onto different shards"""
+        self.assertEqual({'default', 'shard1'}, set(self.lists_by_shard))
+        for alias, task_list in self.lists_by_shard.items():
+            self.assertTrue(TaskList.objects.using(alias).filter(pk=task_list.id).exists())
+            self.assertEqual(1, TaskList.objects.using(alias).count())
+
+    def test_lists_stay_on_their_shard_when_shards_are_added(self):
+        """The shard of a list is recorded when it is created instead of hashed from the current shards"""
+        with override_settings(LIST_SHARDS=['default']):
+            task_list = TaskList.objects.create(owner=self.user, name="single shard list")
+        self.assertEqual('default', ListShard.objects.get(pk=task_list.id).alias)
+        self.assertEqual('default', shard_for_list(task_list.id))
+        with override_settings(LIST_SHARDS=['default', 'shard1', 'shard2']):
+            self.assertEqual('shard1', shard_for_list(self.lists_by_shard['shard1'].id))
+
+    def test_users_are_replicated(self):
+        self.assertEqual('mary', User.objects.using('shard1').get(pk=self.mary.id).username)
+
+    def test_list_views_use_list_shard(self):
+        """Creating and listing items of a list should happen on its shard"""
+        task_list = self.lists_by_shard['shard1']
+        url = '/lists/{}/items/'.format(task_list.id)
+        response = self.client.post(url, data={'name': 'sharded item'})
+        self.assertEqual(201, response.status_code)
+        self.assertTrue(TaskItem.objects.using('shard1').filter(name='sharded item').exists())
+        self.assertFalse(TaskItem.objects.using('default').exists())
+        response = self.client.get(url + '?expand=creator')
+        self.assertEqual([{'id': 1, 'name': 'sharded item', 'url': response.data[0]['url'], 'creator': 'tom'}],
+                         response.data)
+        response = self.client.post('/lists/{}/members/'.format(task_list.id), data={'email': self.mary.email})
+        self.assertEqual(201, response.status_code)
+        self.assertTrue(task_list.members.filter(pk=self.mary.id).exists())
+
+    def test_children_follow_list_outside_requests(self):
+        """Items and reminders created without a request or database should be saved on their list's shard"""
+        item = TaskItem.objects.create(name='item', creator=self.user, task_list=self.lists_by_shard['shard1'])
+        TaskReminder.objects.create(item=item, creator=self.user, task_id='abc')
+        other = TaskItem.objects.create(name='other', creator=self.user, task_list_id=self.lists_by_shard['shard1'].id)
+        self.assertEqual({item.id, other.id}, set(TaskItem.objects.using('shard1').values_list('id', flat=True)))
+        self.assertTrue(TaskReminder.objects.using('shard1').filter(item_id=item.id).exists())
+        self.assertFalse(TaskItem.objects.using('default').exists())
+        self.assertFalse(TaskReminder.objects.using('default').exists())
+
+    def test_member_permissions_on_shard(self):
+        """Object permissions should be granted and checked on the list shard"""
+        task_list = self.lists_by_shard['shard1']
+        task_list.members.add(self.mary)
+        item = task_list.tasks.create(name='item', creator=self.user)
+        response = self.client.post('/lists/{}/items/{}/permissions/'.format(task_list.id, item.id),
+                                    data={"permission": "delete_taskitem", "list_member": self.mary.id})
+        self.assertEqual(201, response.status_code)
+        self.client.force_authenticate(user=self.mary)
+        response = self.client.delete('/lists/{}/items/{}/'.format(task_list.id, item.id))
+        self.assertEqual(204, response.status_code)
+
+    def test_cross_list_views_gather_shards(self):
+        response = self.client.get('/lists/')
+        self.assertEqual(2, len(response.data))
+        response = self.client.get('/bootstrap/')
+        self.assertEqual([self.my_list.id, self.other_list.id], [task_list['id'] for task_list in response.data['results']['lists']])
+        for i in range(3):
+            TaskList.objects.create(owner=self.user, name="list {}".format(i))
+        response = self.client.get('/bootstrap/?page=2&page_size=2')
+        self.assertEqual(5, response.data['count'])
+        self.assertEqual(["list 0", "list 1"], [task_list['name'] for task_list in response.data['results']['lists']])
+        lists = response.data['results']['lists']
+        self.assertEqual({'default', 'shard1'}, {shard_for_list(task_list['id']) for task_list in lists})
+
+    def test_move_list(self):
+        """Moving a list should carry its members, items, reminders and permissions and update the directory"""
+        task_list = self.lists_by_shard['default']
+        task_list.members.add(self.mary)
+        item = task_list.tasks.create(name='item', creator=self.user)
+        reminder = TaskReminder.objects.create(item=item, creator=self.user, task_id='abc')
+        assign_perm('delete_taskitem', self.mary, item)
+        # permission ids differ between shards when they were created in another order
+        permissions = Permission.objects.using('shard1')
+        permission = permissions.get(codename='delete_taskitem')
+        permissions.filter(pk=permission.pk).delete()
+        permissions.create(name=permission.name, codename=permission.codename, content_type_id=permission.content_type_id)
+        self.assertEqual(1, move_list(task_list.id, 'shard1'))
+        self.assertEqual('shard1', shard_for_list(task_list.id))
+        self.assertEqual(('shard1', False), ListShard.objects.filter(pk=task_list.id).values_list('alias', 'moving').get())
+        self.assertFalse(TaskList.objects.using('default').filter(pk=task_list.id).exists())
+        self.assertFalse(TaskItem.objects.using('default').exists())
+        moved = TaskItem.objects.using('shard1').get(pk=item.id)
+        self.assertEqual(reminder.id, TaskReminder.objects.using('shard1').get(item=moved).id)
+        self.assertTrue(TaskList.objects.using('shard1').get(pk=task_list.id).members.filter(pk=self.mary.id).exists())
+        self.client.force_authenticate(user=self.mary)
+        response = self.client.delete('/lists/{}/items/{}/'.format(task_list.id, item.id))
+        self.assertEqual(204, response.status_code)
+
+    def test_list_being_moved_refuses_writes(self):
+        """While a list is copied to another shard requests can read it but not write to it"""
+        task_list = self.lists_by_shard['shard1']
+        ListShard.objects.filter(pk=task_list.id).update(moving=True)
+        url = '/lists/{}/items/'.format(task_list.id)
+        response = self.client.post(url, data={'name': 'lost item'})
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('5', response['Retry-After'])
+        self.assertEqual(200, self.client.get(url).status_code)
+        self.assertFalse(TaskItem.objects.using('shard1').exists())
+
+    def test_tasks_skip_lists_being_moved(self):
+        task_list = self.lists_by_shard['shard1']
+        item = TaskItem.objects.create(name='item', creator=self.user, task_list=task_list)
+        TaskReminder.objects.create(item=item, creator=self.user, interval=timezone.timedelta(days=1),
+                                    next_run_at=timezone.now() - timezone.timedelta(minutes=1),
+                                    recipients='fake@test.com')
+        ListShard.objects.filter(pk=task_list.id).update(moving=True)
+        self.assertEqual(0, send_due_reminders())
+
+    def test_item_ids_are_unique_across_shards(self):
+        items = [TaskItem.objects.create(name='item', creator=self.user, task_list=task_list)
+                 for task_list in (self.my_list, self.other_list, self.my_list)]
+        items += TaskItem.objects.bulk_create([TaskItem(name='bulk', creator=self.user, task_list=self.other_list)])
+        self.assertEqual([1, 2, 3, 4], [item.id for item in items])
+
+    def test_queued_reminder_mail_follows_moved_list(self):
+        task_list = self.lists_by_shard['default']
+        item = task_list.tasks.create(name='item', creator=self.user)
+        reminder = TaskReminder.objects.create(item=item, creator=self.user, task_id='abc')
+        move_list(task_list.id, 'shard1')
+        send_delayed_mail(subject='Reminder', recipients=['fake@fake.com'], message='item',
+                          reminder_id=reminder.id, database='default')
+        self.assertEqual(TaskReminder.SENT, TaskReminder.objects.using('shard1').get(pk=reminder.id).status)
+
+
+SHARED_CACHE_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                           'LOCATION': os.path.join(tempfile.gettempdir(), 'taskit-test-cache')}},
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+}
+
+
+@override_settings(**SHARED_CACHE_SETTINGS)
+class CachedAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_data(self)
+        self.client.login(username='tom', password='password')
+        # warm the session and user caches
+        self.client.get('/lists/')
+
+    def test_warm_session_authenticates_without_queries(self):
+        # the lists of the user only
+        with self.assertNumQueries(1):
+            response = self.client.get('/lists/')
+        self.assertEqual(200, response.status_code)
+
+    def test_saving_user_drops_cached_user(self):
+        self.user.first_name = 'Tom'
+        self.user.save()
+        # user, lists
+        with self.assertNumQueries(2):
+            self.client.get('/lists/')
+
+    def test_changed_password_logs_out_session(self):
+        self.user.set_password('new password')
+        self.user.save()
+        self.assertEqual(401, self.client.get('/lists/').status_code)
+
+    def test_logout_drops_cached_user(self):
+        self.client.logout()
+        self.assertEqual(401, self.client.get('/lists/').status_code)
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+
+class LocalCacheAuthenticationTest(APITestCase):
+
+    def test_local_memory_cache_is_not_used_for_users(self):
+        """A cache local to the process can't be kept in step with the others, users are read every request"""
+        make_data(self)
+        self.client.login(username='tom', password='password')
+        # session, user, lists
+        with self.assertNumQueries(3):
+            self.assertEqual(200, self.client.get('/lists/').status_code)
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+
+class FastJSONRendererTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        TaskItem.objects.bulk_create(
+            TaskItem(name="item {}".format(i), creator=self.user, task_list=self.my_list) for i in range(100)
+        )
+
+    def test_large_response_is_gzipped(self):
+        response = self.client.get('/lists/1/items/?expand=creator,done', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(JSONRenderer().render(response.data), gzip.decompress(response.content))
+
+    def test_response_not_gzipped_unless_accepted(self):
+        response = self.client.get('/lists/1/items/?expand=creator,done', HTTP_ACCEPT_ENCODING='gzip;q=0, *')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(JSONRenderer().render(response.data), response.content)
+
+    def test_small_response_not_gzipped(self):
+        response = self.client.get('/lists/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_browsable_api_not_gzipped(self):
+        response = self.client.get('/lists/1/items/', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'item 99', response.content)
+
+    def test_compress_min_length_setting(self):
+        with override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, COMPRESS_MIN_LENGTH=10 ** 6)):
+            response = self.client.get('/lists/1/items/?expand=creator,done', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_accepts_gzip(self):
+        factory = APIRequestFactory()
+        for header, accepted in (('gzip', True), ('deflate, gzip;q=0.5', True), ('*', True), ('', False),
+                                 ('gzip;q=0', False), ('*, gzip;q=0', False), ('deflate', False)):
+            self.assertEqual(accepted, accepts_gzip(factory.get('/', HTTP_ACCEPT_ENCODING=header)), header)
+
+    @skipIf(orjson is None, "orjson is not installed")
+    def test_orjson_renders_like_json_renderer(self):
+        data = self.client.get('/lists/1/?expand=items,members').data
+        self.assertEqual(json.loads(JSONRenderer().render(data).decode()), json.loads(FastJSONRenderer().render(data).decode()))
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Fails the next failures sends like a mail server that is down"""
+    failures = 0
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            FlakyEmailBackend.failures -= 1
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(messages)
+
+
+@override_settings(
+    CELERY_ALWAYS_EAGER=True,
+    EMAIL_BACKEND='todolist.tests.FlakyEmailBackend',
+    ACCOUNT_MAIL_RETRY_DELAY=0,
+    ACCOUNT_MAIL_MAX_RETRIES=2,
+)
+class AccountMailTest(APITransactionTestCase):
+
+    def tearDown(self):
+        FlakyEmailBackend.failures = 0
+
+    def signup(self):
+        return self.client.post('/rest-auth/registration/', data={
+            'username': 'tom', 'email': 'tom@test.com', 'password1': 'a long password', 'password2': 'a long password'
+        })
+
+    def test_confirmation_mail_is_sent_by_task_after_commit(self):
+        response = self.signup()
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(['tom@test.com'], mail.outbox[0].to)
+        self.assertIn('/rest-auth/registration/account-confirm-email/', mail.outbox[0].body)
+
+    def test_verification_sent_page(self):
+        response = self.client.get('/account-email-verification-sent/')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('message', response.data)
+
+    def test_mail_server_outage_does_not_fail_signup(self):
+        FlakyEmailBackend.failures = 10
+        response = self.signup()
+        self.assertEqual(201, response.status_code)
+        self.assertTrue(User.objects.filter(username='tom').exists())
+        self.assertEqual(0, len(mail.outbox))
+
+    def test_send_account_mail_retries(self):
+        FlakyEmailBackend.failures = 2
+        send_account_mail.delay(subject="Confirm", body="text", from_email="from@test.com", to=['tom@test.com'],
+                                html="<p>html</p>")
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual([("<p>html</p>", 'text/html')], mail.outbox[0].alternatives)
+
+    @override_settings(CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
+    def test_send_account_mail_gives_up(self):
+        FlakyEmailBackend.failures = 3
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            send_account_mail.delay(subject="Confirm", body="text", from_email="from@test.com", to=['tom@test.com'])
+        self.assertEqual(0, len(mail.outbox))
+
+
+class CeleryQueueTest(SimpleTestCase):
+
+    def test_tasks_are_routed_to_their_queue(self):
+        for queue, tasks in TASK_QUEUES.items():
+            for task in tasks:
+                self.assertEqual(queue, celery_app.amqp.router.route({}, task)['queue'].name, task)
+        self.assertEqual('default', celery_app.amqp.router.route({}, 'TaskIt.celery.debug_task')['queue'].name)
+
+    def test_mail_rate_limits(self):
+        self.assertEqual(settings.MAIL_RATE_LIMITS['todolist.tasks.send_delayed_mail'], send_delayed_mail.rate_limit)
+        self.assertEqual(settings.MAIL_RATE_LIMITS['todolist.tasks.send_account_mail'], send_account_mail.rate_limit)
+
+    def test_reminder_latency_with_bulk_backlog(self):
+        """
+        A reminder queued behind a bulk backlog should be picked up by the reminders worker at once,
+        using the in memory broker and running the tasks like the reminders worker would
+        """
+        with celery_app.connection('memory://') as connection:
+            channel = connection.default_channel
+            producer = celery_app.amqp.TaskProducer(connection)
+            self.addCleanup(lambda: [channel.queue_purge(queue) for queue in TASK_QUEUES])
+            for _ in range(500):
+                create_random_user_accounts.apply_async(kwargs={'total': 100}, producer=producer)
+            queued_at = time.perf_counter()
+            send_delayed_mail.apply_async(producer=producer, kwargs={
+                "subject": "Reminder for todo list", "recipients": ['tom@test.com'], "message": "Reminder for item"
+            })
+            # the reminders worker consumes -Q reminders only
+            message = channel.basic_get('reminders', no_ack=True)
+            body = message.decode()
+            celery_app.tasks[body['task']].apply(body['args'], body['kwargs'])
+            latency = time.perf_counter() - queued_at
+            self.assertEqual(9, message.delivery_info['priority'])
+            self.assertEqual(500, channel._size('bulk'))
+        self.assertEqual(1, len(mail.outbox))
+        self.assertLess(latency, 0.5)
+
+
+class StartupBudgetTest(SimpleTestCase):
+
+    def test_startup_within_budget(self):
+        """
+        manage.py check, loading the wsgi app and booting a celery worker should each start within its budget
+        """
+        for name, command in STARTUP_COMMANDS:
+            with self.subTest(name):
+                self.assertLess(time_startup(command), STARTUP_BUDGETS[name])
+
+
 class ItemPermissionViewTest(BaseTestCase):
 
     def setUp(self):
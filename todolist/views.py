@@ -1,10 +1,11 @@
-import requests
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.db.models import CharField, Q, Value
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser
 from rest_framework import status, permissions, generics, serializers
-from celery.result import AsyncResult
+from celery import current_app
 
 from .serializers import (TaskListsSerializer,
                           TaskListSerializer,
@@ -12,10 +13,17 @@ from .serializers import (TaskListsSerializer,
                           ListMembersSerializer,
                           TaskSerializer,
                           CreateTaskRemindersSerializer,
-                          ItemPermissionSerializer
+                          ItemPermissionSerializer,
+                          BulkMembersSerializer,
+                          ItemRowSerializer,
+                          MoveItemSerializer,
+                          AgendaSerializer,
+                          requested_fields,
+                          bootstrap_document
                           )
-from .models import TaskList, TaskItem, User, TaskReminder
-from .permissions import IsListOwnerOrItemCreator
+from .models import TaskList, TaskItem, TaskReminder
+from .permissions import IsListOwnerOrItemCreator, IsListOwnerOrMember
+from .pagination import MembersPagination, BootstrapPagination, AgendaPagination
 
 # Create your views here.
 
@@ -25,25 +33,41 @@ class AccountConfirm(APIView):
 
     def get(self, request, key, *args, **kwargs):
         """Make post request to verify_email endpoint"""
+        # only needed here, so not imported at startup
+        import requests
         r = requests.post('http://127.0.0.1:8000/rest-auth/registration/verify-email/', data={'key': key})
         return Response()
 
 
+class AccountEmailVerificationSent(APIView):
+    """Page allauth sends new users to after signup when email verification is mandatory"""
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        return Response({"message": "A verification email was sent, follow its link to activate your account."})
+
+
 class TaskListsView(generics.ListCreateAPIView):
     serializer_class = TaskListsSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
+        """Gather the user's lists from every list shard"""
         user = self.request.user
-        return user.todo_list.all()
+        return [task_list for alias in settings.LIST_SHARDS for task_list in user.todo_list.using(alias)]
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
 
 class TaskListView(generics.RetrieveAPIView):
-    queryset = TaskList.objects.all()
     serializer_class = TaskListSerializer
+    permission_classes = (permissions.IsAuthenticated, IsListOwnerOrMember)
+    lookup_url_kwarg = 'list_pk'
+
+    def get_queryset(self):
+        fields = TaskListSerializer.requested_fields(self.request)
+        return TaskListSerializer.optimize_queryset(TaskList.objects.all(), fields)
 
 
 class TaskItemView(generics.RetrieveUpdateDestroyAPIView):
@@ -51,7 +75,11 @@ class TaskItemView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsListOwnerOrItemCreator,)
 
     def get_object(self):
-        item = get_object_or_404(TaskItem, task_list_id=self.kwargs['list_pk'], pk=self.kwargs['pk'])
+        fields = TaskSerializer.requested_fields(self.request)
+        # the permission check reads the list owner
+        queryset = TaskSerializer.optimize_queryset(TaskItem.objects.all(), fields,
+                                                    related=('task_list',), columns=('task_list__owner_id',))
+        item = get_object_or_404(queryset, task_list_id=self.kwargs['list_pk'], pk=self.kwargs['pk'])
         self.check_object_permissions(self.request, item)
         return item
 
@@ -62,16 +90,16 @@ class CreateReminderView(APIView):
     parser_classes = (JSONParser,)
 
     def post(self, request, list_pk, pk, *args, **kwargs):
-        item = get_object_or_404(TaskItem, pk=self.kwargs['pk'])
         serializer = CreateTaskRemindersSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(creator=request.user, item=item)
+        serializer.save(creator=request.user, item_id=pk, list_id=list_pk)
         return Response({"message": "Reminder created"}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, list_pk, pk, *args, **kwargs):
-        item = get_object_or_404(TaskItem, pk=self.kwargs['pk'])
+        item = get_object_or_404(TaskItem, task_list_id=list_pk, pk=pk)
         reminder = get_object_or_404(TaskReminder, item=item)
-        AsyncResult(reminder.task_id).revoke()
+        if reminder.task_id:
+            current_app.control.revoke(reminder.task_id)
         reminder.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -80,9 +108,19 @@ class CreateListItem(generics.ListCreateAPIView):
     queryset = TaskItem.objects.all()
     serializer_class = CreateTaskSerializer
     permission_classes = (permissions.IsAuthenticated, IsListOwnerOrItemCreator)
+    expandable_fields = ('creator', 'done', 'due_at', 'task_reminder', 'reminder', 'list')
 
     def get_queryset(self):
-        return TaskItem.objects.filter(task_list_id=self.kwargs['list_pk'])
+        return TaskItem.objects.filter(task_list_id=self.kwargs['list_pk']).order_by('rank', 'id')
+
+    def list(self, request, *args, **kwargs):
+        """
+        List items through the values() fast path, renders the same as CreateTaskSerializer.
+        TaskSerializer fields can be added with ?expand= and ?fields= narrows the result.
+        """
+        fields = requested_fields(request, ItemRowSerializer.columns, self.expandable_fields)
+        rows = ItemRowSerializer(fields, request=request)
+        return Response(rows.serialize(self.get_queryset()))
 
     def perform_create(self, serializer):
         task_list = get_object_or_404(TaskList, pk=self.kwargs['list_pk'])
@@ -90,26 +128,40 @@ class CreateListItem(generics.ListCreateAPIView):
 
 
 class ListMembersView(APIView):
+    pagination_class = MembersPagination
+    permission_classes = (permissions.IsAuthenticated, IsListOwnerOrItemCreator)
 
     def get(self, request, list_pk=None):
-        """Return list of users that are members of task list"""
-        list_id = list_pk
-        my_list = TaskList.objects.get(pk=list_id)
-        all_members = my_list.members.all()
-        members = ListMembersSerializer(all_members, many=True, read_only=True)
-        return Response(members.data)
+        """Return a page of users that are members of task list"""
+        task_list = get_object_or_404(TaskList, pk=list_pk)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(task_list.members.order_by('pk'), request, view=self)
+        members = ListMembersSerializer(page, many=True, read_only=True, context={'request': request})
+        return paginator.get_paginated_response(members.data)
 
     def post(self, request, list_pk=None):
-        """Add user to task list"""
-        try:
-            email = request.data['email']
-        except KeyError:
-            return Response({"message": "Email of user to add required."}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            add_user = get_object_or_404(User, email=email)
-            task_list = get_object_or_404(TaskList, pk=list_pk)
-            task_list.members.add(add_user)
-            return Response({"message": "User added"}, status=status.HTTP_201_CREATED)
+        """Add one or many users to task list"""
+        task_list = get_object_or_404(TaskList, pk=list_pk)
+        serializer = BulkMembersSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        report = serializer.save(task_list=task_list)
+        if report['added']:
+            return Response(dict(report, message="Users added"), status=status.HTTP_201_CREATED)
+        if report['already_members']:
+            return Response(dict(report, message="Users already members"), status=status.HTTP_200_OK)
+        return Response(dict(report, message="Users not found"), status=status.HTTP_404_NOT_FOUND)
+
+    def delete(self, request, list_pk=None):
+        """Remove one or many users from task list, only its owner can"""
+        task_list = get_object_or_404(TaskList, pk=list_pk)
+        if task_list.owner_id != request.user.id:
+            return Response({"message": "Only the list owner can remove members."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = BulkMembersSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        report = serializer.remove(task_list)
+        return Response(dict(report, message="Users removed"), status=status.HTTP_200_OK)
 
 
 class ItemPermissionsView(generics.GenericAPIView):
@@ -132,3 +184,67 @@ class ItemPermissionsView(generics.GenericAPIView):
         serializer.is_valid(raise_exception=True)
         serializer.save(creator=request.user, item=list_item)
         return Response({"message": "Permission added"}, status=status.HTTP_201_CREATED)
+
+
+class MoveItemView(generics.GenericAPIView):
+    """View to move an item within its list"""
+    serializer_class = MoveItemSerializer
+    permission_classes = (IsListOwnerOrItemCreator, )
+
+    def get_object(self):
+        queryset = TaskItem.objects.select_related('task_list').only('id', 'task_list_id', 'creator_id',
+                                                                     'task_list__owner_id')
+        item = get_object_or_404(queryset, pk=self.kwargs['pk'], task_list_id=self.kwargs['list_pk'])
+        self.check_object_permissions(self.request, item)
+        return item
+
+    def post(self, request, list_pk=None, pk=None):
+        """Move item after the item given, or to the top of the list"""
+        serializer = MoveItemSerializer(self.get_object(), data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"message": "Item moved"}, status=status.HTTP_200_OK)
+
+
+class BootstrapView(APIView):
+    """Return the user's lists, their items and members in one round trip"""
+    pagination_class = BootstrapPagination
+
+    def get(self, request):
+        """The user's lists are paginated by id in the database, merging the pages of every list shard"""
+        querysets = []
+        for alias in settings.LIST_SHARDS:
+            user_lists = TaskList.objects.using(alias).filter(Q(owner=request.user) | Q(members=request.user))
+            querysets.append(user_lists.distinct().annotate(shard=Value(alias, output_field=CharField())).values(
+                'id', 'name', 'owner_id', 'owner__username', 'shard'
+            ).order_by('id'))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(querysets, request, view=self)
+        return paginator.get_paginated_response(bootstrap_document(page, request))
+
+
+class AgendaView(APIView):
+    """
+    Return the not done items due in a window, by default the next seven days and everything overdue,
+    across every list the user owns or belongs to. Example /agenda/?since=2017-10-02T00:00Z&until=2017-10-09T00:00Z
+    """
+    pagination_class = AgendaPagination
+    fields = ('id', 'name', 'url', 'due_at', 'list')
+
+    def get(self, request):
+        """Items are read through the (due_at, done) index, one query per list shard"""
+        window = AgendaSerializer(data=request.query_params)
+        window.is_valid(raise_exception=True)
+        rows = ItemRowSerializer(self.fields, request=request)
+        querysets = []
+        for alias in settings.LIST_SHARDS:
+            memberships = TaskList.members.through.objects.using(alias).filter(user_id=request.user.id)
+            items = TaskItem.objects.using(alias).filter(done=False, due_at__lt=window.validated_data['until']).filter(
+                Q(task_list__owner_id=request.user.id) | Q(task_list_id__in=memberships.values('tasklist_id'))
+            )
+            if 'since' in window.validated_data:
+                items = items.filter(due_at__gte=window.validated_data['since'])
+            querysets.append(items.values(*rows.get_columns()))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(querysets, request, view=self)
+        return paginator.get_paginated_response([rows.to_representation(row) for row in page])